@@ -1,30 +1,136 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, abort
+from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, g, jsonify, Response, make_response, send_from_directory, stream_with_context, has_request_context, current_app, before_render_template, template_rendered
 import os
+import base64
+import csv
+import hashlib
+import json
+import logging
+import mimetypes
+import multiprocessing
+import queue
+import random
+import re
+import threading
+import time
+import warnings
+import zipfile
+from collections import OrderedDict
+from itertools import islice
+from xml.etree import ElementTree
+import click
 import pymysql
+from pymysql.constants import CR
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
-from functools import wraps
+from werkzeug.wsgi import ClosingIterator
+from flask.cli import with_appcontext
+from functools import wraps, lru_cache, partial
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import date
+from dataclasses import dataclass
+from prometheus_client import CollectorRegistry, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+from spreadsheets import csv_chunks, xlsx_chunks, csv_rows, xlsx_rows
+import seed
+import assets
+from compression import CompressionMiddleware
+from cpus import cpu_quota, gunicorn_workers
 
-app = Flask(__name__)
-app.secret_key = 'your_secret_key_here'  # Change this in production!
-MYSQL_CONFIG = {
-    'host': os.getenv('MYSQL_HOST'),
-    'port': int(os.getenv('MYSQL_PORT')),
-    'user': os.getenv('MYSQL_USER'),
-    'password': os.getenv('MYSQL_PASSWORD'),
-    'database': os.getenv('MYSQL_DB'),
-    'charset': 'utf8mb4',
-}
-current_year= date.today().year
 
+def mysql_config():
+    # read when a connection is opened, not at import, so the module (and
+    # gunicorn's preload) works before the database settings are in place
+    return {
+        'host': os.getenv('MYSQL_HOST', 'localhost'),
+        'port': int(os.getenv('MYSQL_PORT') or 3306),
+        'user': os.getenv('MYSQL_USER'),
+        'password': os.getenv('MYSQL_PASSWORD'),
+        'database': os.getenv('MYSQL_DB'),
+        'charset': 'utf8mb4',
+    }
+
+
+# Connection pool settings (per worker process)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '1800'))
+# connections each worker opens before taking traffic
+DB_POOL_PRIME = int(os.getenv('DB_POOL_PRIME', '2'))
+
+
+def current_year():
+    # evaluated per request so long-lived workers roll over at New Year
+    return date.today().year
+
+
+# Routes are collected here and bound in create_app(), so importing the
+# module registers nothing on a global app and the endpoint names stay
+# the view function names.
+_routes = []
+
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+class Row:
+    # Tuple-backed result row. Column positions live in one dict shared by
+    # every row of a result set, so both row[0] and row['name'] are O(1)
+    # and a row costs a single small object on top of the cursor's tuple.
+    __slots__ = ('_values', '_index')
+
+    def __init__(self, values, index):
+        self._values = values
+        self._index = index
 
-class CompatRow(dict):
     def __getitem__(self, key):
-        if isinstance(key, int):
-            return tuple(self.values())[key]
-        return super().__getitem__(key)
+        if isinstance(key, (int, slice)):
+            return self._values[key]
+        return self._values[self._index[key]]
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else self._values[i]
+
+    def keys(self):
+        return self._index.keys()
+
+    def values(self):
+        return self._values
+
+    def items(self):
+        return zip(self._index, self._values)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, Row):
+            return self._values == other._values and self._index == other._index
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return 'Row(%r)' % dict(self.items())
+
+
+# Every statement in this file is a literal, so the working set is small and
+# each distinct text only needs translating once per process.
+SQL_CACHE_SIZE = int(os.getenv('SQL_CACHE_SIZE', '1024'))
 
 
+@lru_cache(maxsize=SQL_CACHE_SIZE)
 def adapt_sql_query(query):
     adapted = query.replace('==', '=')
     adapted = adapted.replace('?', '__PARAM__')
@@ -33,10 +139,193 @@ def adapt_sql_query(query):
     return adapted
 
 
-def wrap_row(row):
-    if isinstance(row, dict):
-        return CompatRow(row)
-    return row
+def sql_statement_stats():
+    info = adapt_sql_query.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'statements': info.currsize, 'max_statements': info.maxsize}
+
+
+def row_index(description):
+    # column name -> position; the first of duplicate names wins
+    index = {}
+    for i, column in enumerate(description):
+        index.setdefault(column[0], i)
+    return index
+
+
+# Request metrics, exposed in Prometheus text format on /metrics. Under
+# gunicorn each worker writes its samples into PROMETHEUS_MULTIPROC_DIR
+# (set up in gunicorn.conf.py) and a scrape merges every worker's files.
+REQUEST_SECONDS = Histogram('app_request_seconds', 'Time spent handling a request', ['endpoint'])
+REQUEST_DB_SECONDS = Histogram('app_request_db_seconds', 'Time spent in database statements per request', ['endpoint'])
+REQUEST_TEMPLATE_SECONDS = Histogram('app_request_template_seconds', 'Time spent rendering templates per request',
+                                     ['endpoint'])
+REQUEST_QUERIES = Histogram('app_request_queries', 'Database statements executed per request', ['endpoint'],
+                            buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250, 500))
+
+
+class RequestMetrics:
+    # WSGI middleware: per-request totals ride along in the environ and are
+    # observed once the body has been sent, so a streamed export counts
+    # its whole transfer and the queries its generator runs
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        stats = environ['app.metrics'] = {
+            'endpoint': 'unmatched', 'started': time.perf_counter(),
+            'db_seconds': 0.0, 'db_queries': 0, 'template_seconds': 0.0,
+        }
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            observe_request(stats)
+            raise
+        return ClosingIterator(body, lambda: observe_request(stats))
+
+
+def observe_request(stats):
+    endpoint = stats['endpoint']
+    REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - stats['started'])
+    REQUEST_DB_SECONDS.labels(endpoint).observe(stats['db_seconds'])
+    REQUEST_TEMPLATE_SECONDS.labels(endpoint).observe(stats['template_seconds'])
+    REQUEST_QUERIES.labels(endpoint).observe(stats['db_queries'])
+
+
+def request_stats():
+    # statements run outside a request (warm-up, CLI) are not counted
+    return request.environ.get('app.metrics') if has_request_context() else None
+
+
+def label_request_metrics():
+    stats = request_stats()
+    if stats is not None and request.endpoint:
+        stats['endpoint'] = request.endpoint
+
+
+def count_query(elapsed):
+    stats = request_stats()
+    if stats is not None:
+        stats['db_seconds'] += elapsed
+        stats['db_queries'] += 1
+    return stats
+
+
+def record_query(query, params, elapsed, connection=None):
+    stats = count_query(elapsed)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        log_slow_query(query, params, elapsed, stats, connection)
+    if stats is not None and QUERY_GUARD != 'off':
+        check_query_budget(query, stats)
+
+
+def start_template_timer(sender, template, context, **extra):
+    stats = request_stats()
+    if stats is not None:
+        stats['template_started'] = time.perf_counter()
+
+
+def stop_template_timer(sender, template, context, **extra):
+    stats = request_stats()
+    if stats is not None and 'template_started' in stats:
+        stats['template_seconds'] += time.perf_counter() - stats.pop('template_started')
+
+
+# Query guard. Statements slower than SLOW_QUERY_MS are logged with their
+# parameters and route, plus the EXPLAIN plan when SLOW_QUERY_EXPLAIN is
+# on. A request that repeats one normalized statement more than
+# QUERY_REPEAT_LIMIT times, or runs more than QUERY_BUDGET statements, is
+# reported as a likely N+1: a QueryBudgetWarning normally, an error under
+# app.testing or QUERY_GUARD=raise.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'false').lower() in ('1', 'true', 'yes', 'on')
+QUERY_REPEAT_LIMIT = int(os.getenv('QUERY_REPEAT_LIMIT', '5'))
+QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', '30'))
+QUERY_GUARD = os.getenv('QUERY_GUARD', 'warn')  # warn | raise | off
+
+sql_log = logging.getLogger('app.sql')
+
+_SQL_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+\b")
+_SQL_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+class QueryBudgetWarning(UserWarning):
+    pass
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@lru_cache(maxsize=SQL_CACHE_SIZE)
+def normalize_sql(query):
+    # one shape per statement: whitespace folded, literals and IN lists
+    # of any length reduced to placeholders
+    text = _SQL_LITERALS.sub('?', ' '.join(query.split()))
+    return _SQL_IN_LIST.sub('(?)', text)
+
+
+def describe_params(params):
+    if isinstance(params, list) and params and isinstance(params[0], (list, tuple)):
+        return '<%d rows>' % len(params)
+    text = repr(params)
+    return text if len(text) <= 500 else text[:500] + '...'
+
+
+def explain_query(connection, query, params):
+    # raw cursor, so the EXPLAIN itself is neither counted nor logged
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN ' + adapt_sql_query(query), params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, values)) for values in cursor.fetchall()]
+    except pymysql.err.MySQLError as e:
+        return 'EXPLAIN failed: %s' % e
+    finally:
+        cursor.close()
+
+
+def log_slow_query(query, params, elapsed, stats, connection):
+    route_name = stats['endpoint'] if stats is not None else '-'
+    plan = None
+    if SLOW_QUERY_EXPLAIN and connection is not None and query.lstrip()[:6].upper() == 'SELECT':
+        plan = explain_query(connection, query, params)
+    sql_log.warning('slow query %.1fms in %s: %s params=%s%s', elapsed * 1000, route_name,
+                    ' '.join(query.split()), describe_params(params), ' plan=%s' % plan if plan else '')
+
+
+def report_query_budget(message):
+    if QUERY_GUARD == 'raise' or current_app.testing:
+        raise QueryBudgetExceeded(message)
+    warnings.warn(message, QueryBudgetWarning, stacklevel=2)
+
+
+def check_query_budget(query, stats):
+    statement = normalize_sql(query)
+    counts = stats.setdefault('statements', {})
+    counts[statement] = counts.get(statement, 0) + 1
+    # each limit is reported once per request, when it is first crossed
+    repeat_limit = stats.get('repeat_limit', QUERY_REPEAT_LIMIT)
+    if repeat_limit and counts[statement] == repeat_limit + 1:
+        report_query_budget('%s ran the same statement more than %d times (likely N+1): %s'
+                            % (stats['endpoint'], repeat_limit, statement))
+    budget = stats.get('query_budget', QUERY_BUDGET)
+    if budget and stats['db_queries'] == budget + 1:
+        report_query_budget('%s ran more than %d statements' % (stats['endpoint'], budget))
+
+
+def query_budget(total=None, repeat=None):
+    # per-view override of QUERY_BUDGET / QUERY_REPEAT_LIMIT for routes
+    # that are expected to run many statements; None switches a check off
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            stats = request_stats()
+            if stats is not None:
+                stats['query_budget'] = total
+                stats['repeat_limit'] = repeat
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
 
 
 class MySQLCursor:
@@ -46,58 +335,331 @@ class MySQLCursor:
     def execute(self, query, params=None):
         if params is None:
             params = ()
-        self._cursor.execute(adapt_sql_query(query), params)
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(adapt_sql_query(query), params)
+        except BaseException:
+            # only counted: the slow-query log and the query guard must not
+            # replace the statement's own error
+            count_query(time.perf_counter() - started)
+            raise
+        record_query(query, params, time.perf_counter() - started, self._cursor.connection)
         return self
     
     def executemany(self, query, params=None):
         if params is None:
             params = ()
-        self._cursor.executemany(adapt_sql_query(query), params)
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(adapt_sql_query(query), params)
+        except BaseException:
+            count_query(time.perf_counter() - started)
+            raise
+        record_query(query, params, time.perf_counter() - started)
         return self
     
     
 
     def fetchone(self):
-        return wrap_row(self._cursor.fetchone())
+        values = self._cursor.fetchone()
+        if values is None:
+            return None
+        return Row(values, row_index(self._cursor.description))
 
     def fetchall(self):
-        return [wrap_row(row) for row in self._cursor.fetchall()]
+        rows = self._cursor.fetchall()
+        if not rows:
+            return []
+        index = row_index(self._cursor.description)
+        return [Row(values, index) for values in rows]
 
     def __getattr__(self, name):
         return getattr(self._cursor, name)
 
 
-class MySQLConnection:
-    def __init__(self):
-        self._conn = pymysql.connect(
-            **MYSQL_CONFIG,
-            cursorclass=pymysql.cursors.DictCursor,
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, size, timeout, max_age, config=mysql_config):
+        self.size = size
+        self.config = config
+        self.timeout = timeout
+        self.max_age = max_age
+        # LIFO keeps the hottest connections in use and lets idle ones age out
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        raw = pymysql.connect(
+            **self.config(),
+            cursorclass=pymysql.cursors.Cursor,
             autocommit=False
         )
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout('no database connection available within %ss' % self.timeout)
+        try:
+            while True:
+                try:
+                    raw, created = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - created > self.max_age:
+                    self._discard(raw)
+                    continue
+                # validate on checkout, drop connections the server has closed
+                try:
+                    raw.ping(reconnect=False)
+                except Exception:
+                    self._discard(raw)
+                    continue
+                return raw, created
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, raw, created):
+        try:
+            # never hand out a connection with an open transaction
+            raw.rollback()
+            self._idle.put((raw, created))
+        except Exception:
+            self._discard(raw)
+        finally:
+            self._slots.release()
+
+    def clear(self):
+        while True:
+            try:
+                raw, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(raw)
+
+    def prime(self, count):
+        # best effort: a database that is not up yet just means the first
+        # requests connect on demand as before
+        for _ in range(min(count, self.size) - self._idle.qsize()):
+            try:
+                self._idle.put(self._connect())
+            except pymysql.err.MySQLError:
+                return
+
+    def reset(self):
+        # after fork: the inherited sockets belong to the parent, so drop
+        # them without close() (which would send QUIT on the shared
+        # connection) and start over with fresh, unlocked primitives
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+
+db_pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_CONN_MAX_AGE)
+
+
+# Read replicas: MYSQL_REPLICAS is a comma-separated list of host[:port]
+# replicating the primary, reached with the primary's credentials. GET
+# requests of views marked @read_only run on one of them; writes and all
+# other views stay on the primary.
+MYSQL_REPLICAS = [address.strip() for address in os.getenv('MYSQL_REPLICAS', '').split(',') if address.strip()]
+# a replica further behind than this (seconds) is skipped until it catches up
+REPLICA_MAX_LAG = int(os.getenv('REPLICA_MAX_LAG', '2'))
+REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', '5'))
+REPLICA_CONNECT_TIMEOUT = int(os.getenv('REPLICA_CONNECT_TIMEOUT', '1'))
+# reads stay on the primary this long after a session's last commit, so
+# users see their own submissions; keep it above REPLICA_MAX_LAG
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', '10'))
+# client errors meaning the replica itself is gone, not that the statement
+# failed (an unknown column, a deadlock or max_execution_time are raised)
+REPLICA_LOST_ERRORS = {CR.CR_CONN_HOST_ERROR, CR.CR_SERVER_GONE_ERROR, CR.CR_SERVER_LOST}
+
+db_log = logging.getLogger('app.db')
+
+
+def replica_config(address):
+    host, _, port = address.partition(':')
+    return {**mysql_config(), 'host': host, 'port': int(port or 3306), 'connect_timeout': REPLICA_CONNECT_TIMEOUT}
+
+
+class ReplicaUnavailable(Exception):
+    pass
+
+
+class ReplicaPool(ConnectionPool):
+    # a replica that is down, not replicating or lagging is left alone for
+    # REPLICA_CHECK_INTERVAL; a healthy one is re-checked just as often
+    def __init__(self, address, size, timeout, max_age):
+        super().__init__(size, timeout, max_age, config=partial(replica_config, address))
+        self.address = address
+        self._healthy = True
+        self._checked = float('-inf')
+
+    def available(self):
+        return self._healthy or time.monotonic() - self._checked > REPLICA_CHECK_INTERVAL
+
+    def _mark(self, healthy, reason=''):
+        if self._healthy and not healthy:
+            db_log.warning('skipping replica %s: %s', self.address, reason)
+        self._healthy = healthy
+        self._checked = time.monotonic()
+
+    def _lag(self, raw):
+        with raw.cursor() as cursor:
+            cursor.execute('SHOW REPLICA STATUS')
+            values = cursor.fetchone()
+            if values is None:
+                return None
+            return dict(zip([column[0] for column in cursor.description], values))['Seconds_Behind_Source']
+
+    def acquire(self):
+        try:
+            raw, created = super().acquire()
+        except pymysql.err.MySQLError as e:
+            self._mark(False, e)
+            raise ReplicaUnavailable(self.address) from e
+        if time.monotonic() - self._checked > REPLICA_CHECK_INTERVAL:
+            try:
+                lag = self._lag(raw)
+                # NULL while the replication threads are stopped
+                self._mark(lag is not None and lag <= REPLICA_MAX_LAG, 'replication lag %s' % lag)
+            except pymysql.err.MySQLError as e:
+                self._mark(False, e)
+        if not self._healthy:
+            self.release(raw, created)
+            raise ReplicaUnavailable(self.address)
+        return raw, created
+
+
+replica_pools = [ReplicaPool(address, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_CONN_MAX_AGE) for address in MYSQL_REPLICAS]
+
+
+class MySQLConnection:
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn, self._created = pool.acquire()
+        # departments inserted by the open transaction, name -> id; shared
+        # with other requests (_department_ids) only once committed
+        self.new_departments = {}
 
     def execute(self, query, params=None):
-        cursor = self.cursor()
-        cursor.execute(query, params)
-        return cursor
+        return self.on_primary_if_replica_fails(lambda: self.cursor().execute(query, params))
     
     def executemany(self, query, params=None):
-        cursor = self.cursor()
-        cursor.executemany(query, params)
-        return cursor
+        return self.on_primary_if_replica_fails(lambda: self.cursor().executemany(query, params))
+
+    def on_primary_if_replica_fails(self, statement):
+        # a replica lost mid-request is skipped like one failing its check,
+        # and this statement and the rest of the request go to the primary
+        try:
+            return statement()
+        except pymysql.err.OperationalError as e:
+            if not isinstance(self._pool, ReplicaPool):
+                raise
+            if e.args[0] not in REPLICA_LOST_ERRORS and self._conn.open:
+                raise
+            self._pool._mark(False, e)
+            self.close()
+            self._pool = db_pool
+            self._conn, self._created = db_pool.acquire()
+            return statement()
 
 
     def cursor(self):
         return MySQLCursor(self._conn.cursor())
 
+    def stream(self, query, params=None, size=1000):
+        # Unbuffered server-side cursor: rows stay on the socket until read,
+        # so a result of any size is walked in batches of `size`.
+        def execute():
+            cursor = self._conn.cursor(pymysql.cursors.SSCursor)
+            cursor.execute(adapt_sql_query(query), params or ())
+            return cursor
+        started = time.perf_counter()
+        cursor = self.on_primary_if_replica_fails(execute)
+        # no EXPLAIN here: the streamed rows are still unread on the socket
+        record_query(query, params, time.perf_counter() - started)
+        columns = [column[0] for column in cursor.description]
+
+        def batches():
+            try:
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+        return columns, batches()
+
     def commit(self):
         self._conn.commit()
+        _department_ids.update(self.new_departments)
+        self.new_departments = {}
+        if has_request_context():
+            # read-your-writes: this session's reads go to the primary for a while
+            session['wrote_at'] = time.time()
+
+    def rollback(self):
+        self._conn.rollback()
+        for name in self.new_departments:
+            _department_ids.pop(name, None)
+        self.new_departments = {}
 
     def close(self):
-        self._conn.close()
+        # hand the connection back to the pool instead of disconnecting
+        if self._conn is not None:
+            self._pool.release(self._conn, self._created)
+            self._conn = None
 
 
 def get_db_connection():
-    return MySQLConnection()
+    # one pooled connection per request, released in close_db_connection
+    if 'db' not in g:
+        g.db = (reads_from_replica() and replica_connection()) or MySQLConnection(db_pool)
+    return g.db
+
+
+def reads_from_replica():
+    return (replica_pools and g.get('read_only') and request.method in ('GET', 'HEAD')
+            and time.time() - session.get('wrote_at', 0) > REPLICA_STICKY_SECONDS)
+
+
+def replica_connection():
+    # replicas are tried from a random one on; None falls back to the primary
+    start = random.randrange(len(replica_pools))
+    for pool in replica_pools[start:] + replica_pools[:start]:
+        if not pool.available():
+            continue
+        try:
+            return MySQLConnection(pool)
+        except (ReplicaUnavailable, PoolTimeout):
+            continue
+    return None
+
+
+def read_only(view):
+    # the view only reads, so its GET requests may be served by a replica;
+    # goes right under @route, before anything opens the connection
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def close_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        conn.close()
 
 
 # Login required decorator
@@ -124,8 +686,300 @@ def admin_required(f):
     return decorated_function
 
 
+# Like admin_required, but answers with the not-found page. Placed above
+# @conditional so a 304 (and its ETag) is only ever given to an allowed role.
+def reviewer_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('role') != 'admin' and session.get('role') != 'head':
+            return render_template('page-404.html', error_msg='Page Not Found')
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+# Data versions: change counters in the data_versions table, bumped by every
+# write in the write's own transaction, so all workers and replicas see a
+# change at once. A write to `table` for some users bumps
+#   user:<id>:<table>          once per user
+#   department:<id>:<table>    once per department of those users
+#   all:<table>                once
+# Rendered profile sections and conditional GETs are keyed on them.
+def version_scope(user_id, table):
+    return 'user:%d:%s' % (user_id, table)
+
+
+def department_scope(department_id, table):
+    return 'department:%d:%s' % (department_id, table)
+
+
+def table_scope(table):
+    return 'all:%s' % table
+
+
+def bump_versions(conn, scopes):
+    # call before commit, so the bump lands with the write or not at all;
+    # sorted, so concurrent writers take the row locks in the same order
+    scopes = sorted(set(scopes))
+    conn.executemany('''
+        INSERT INTO data_versions (scope, version) VALUES (?, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    ''', [(scope,) for scope in scopes])
+    known = g.get('data_versions')
+    if known:
+        for scope in scopes:
+            known.pop(scope, None)
+
+
+def bump_data_versions(conn, table, user_ids):
+    user_ids = sorted(set(user_ids))
+    departments = conn.execute(
+        'SELECT DISTINCT department_id FROM users WHERE id IN (%s)' % ', '.join(['?'] * len(user_ids)),
+        tuple(user_ids)).fetchall()
+    bump_versions(conn, [version_scope(user_id, table) for user_id in user_ids]
+                  + [department_scope(row['department_id'], table) for row in departments] + [table_scope(table)])
+
+
+def bump_department_versions(conn, table, department_ids):
+    bump_versions(conn, [department_scope(department_id, table) for department_id in department_ids]
+                  + [table_scope(table)])
+
+
+def data_versions(conn, scopes):
+    # read at most once per request; missing scopes are version 0
+    known = g.setdefault('data_versions', {})
+    missing = [scope for scope in scopes if scope not in known]
+    if missing:
+        rows = conn.execute('SELECT scope, version FROM data_versions WHERE scope IN (%s)'
+                            % ', '.join(['?'] * len(missing)), tuple(missing)).fetchall()
+        found = {row['scope']: row['version'] for row in rows}
+        for scope in missing:
+            known[scope] = found.get(scope, 0)
+    return {scope: known[scope] for scope in scopes}
+
+
+# Conditional GET: a read view decorated with @conditional(scopes) gets a
+# strong ETag derived from the data versions it is rendered from (scopes
+# maps the view's arguments to scope names), the viewer, the URL and the
+# release. A matching If-None-Match is answered with 304 before the view
+# runs a query or renders anything.
+def release_id(app):
+    # changes with the code, templates or assets, so a deploy never answers
+    # 304 for a page the previous release rendered
+    digest = hashlib.sha1()
+    paths = [os.path.abspath(__file__), os.path.join(app.config['ASSETS_DIR'], assets.MANIFEST)]
+    for dirpath, dirnames, filenames in os.walk(os.path.join(app.root_path, app.template_folder)):
+        dirnames.sort()
+        paths += [os.path.join(dirpath, filename) for filename in sorted(filenames)]
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        except FileNotFoundError:
+            pass
+    return digest.hexdigest()
+
+
+def page_etag(conn, scopes):
+    versions = data_versions(conn, scopes)
+    # pending flashes count too: a page that shows them renders differently
+    viewer = (session.get('user_id'), session.get('role'), session.get('department_id'), session.get('_flashes'))
+    return hashlib.sha1(repr((current_app.extensions['release'], viewer, request.full_path,
+                              sorted(versions.items()))).encode('utf-8')).hexdigest()
+
+
+def revalidate(response, etag):
+    response.set_etag(etag)
+    # the browser may keep the page but has to ask before showing it again
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def conditional(scopes):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            etag = page_etag(get_db_connection(), scopes(**kwargs))
+            if request.if_none_match.contains_weak(etag):
+                return revalidate(current_app.response_class(status=304), etag)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                revalidate(response, etag)
+            return response
+        return wrapper
+    return decorator
+
+
+# Departments are a small dimension table; names are resolved to ids once per
+# process and every department filter is an indexed users.department_id lookup.
+_department_ids = {}
+
+
+def department_id(conn, name):
+    dept_id = _department_ids.get(name) or conn.new_departments.get(name)
+    if dept_id is None:
+        row = conn.execute('SELECT id FROM departments WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        dept_id = _department_ids[name] = row['id']
+    return dept_id
+
+
+def ensure_department(conn, name):
+    dept_id = department_id(conn, name)
+    if dept_id is None:
+        # the insert belongs to the caller's transaction: the id is cached
+        # when that commits and forgotten if it rolls back
+        conn.execute('INSERT IGNORE INTO departments (name) VALUES (?)', (name,))
+        dept_id = conn.execute('SELECT id FROM departments WHERE name = ?', (name,)).fetchone()['id']
+        conn.new_departments[name] = dept_id
+    return dept_id
+
+
+def session_department_id():
+    # sessions from before the departments table only carry the name
+    if 'department_id' not in session:
+        session['department_id'] = department_id(get_db_connection(), session['department'])
+    return session['department_id']
+
+
+# Keyset pagination for the listing pages: pages are addressed by an opaque
+# cursor holding the sort key of the last row shown, so every page is an
+# index range scan of PAGE_SIZE rows no matter how deep it is.
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '200'))
+
+
+def page_size():
+    size = request.args.get('limit', PAGE_SIZE, type=int)
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(value, width):
+    # a malformed cursor just falls back to the first page
+    if not value:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(value.encode('ascii')))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != width:
+        return None
+    return values
+
+
+def keyset_page(conn, query, params, order_by, cursor=None, descending=False):
+    # query has no ORDER BY; order_by lists the qualified key columns, the
+    # last one being unique (the primary key)
+    limit = page_size()
+    after = decode_cursor(cursor, len(order_by))
+    params = tuple(params)
+    if after is not None:
+        op = '<' if descending else '>'
+        clauses = []
+        for i, column in enumerate(order_by):
+            terms = ['%s = ?' % c for c in order_by[:i]] + ['%s %s ?' % (column, op)]
+            clauses.append('(' + ' AND '.join(terms) + ')')
+            params += tuple(after[:i + 1])
+        query += (' AND ' if 'WHERE' in query else ' WHERE ') + '(' + ' OR '.join(clauses) + ')'
+    direction = ' DESC' if descending else ''
+    query += ' ORDER BY ' + ', '.join(c + direction for c in order_by) + ' LIMIT ?'
+    rows = conn.execute(query, params + (limit + 1,)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][c.split('.')[-1]] for c in order_by])
+    return rows, next_cursor
+
+
+# Password hashing runs in a per-worker process pool: scrypt/PBKDF2 is
+# CPU-bound on purpose, so doing it inline pins the request thread and the
+# GIL. Request threads only wait on the future. The pool is created on
+# first use so it is never inherited across a gunicorn fork.
+# per gunicorn worker, each of which starts its own pool: the container's
+# CPUs split between the workers, at least one each
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS') or max(1, cpu_quota() // gunicorn_workers()))
+# Bulk provisioning (roster import, temp_data) is rare and wants every core,
+# which the per-worker pool above does not have: each batch gets a pool of
+# its own, at most BULK_HASH_WORKERS processes, shut down once it is hashed.
+BULK_HASH_WORKERS = int(os.getenv('BULK_HASH_WORKERS') or cpu_quota())
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            # forkserver children start clean instead of copying the
+            # worker's open database sockets
+            _hash_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS,
+                                             mp_context=multiprocessing.get_context('forkserver'))
+        return _hash_pool
+
+
+def with_hash_pool(work):
+    global _hash_pool
+    pool = hash_pool()
+    try:
+        return work(pool)
+    except BrokenProcessPool:
+        # a killed child breaks the whole pool; start a fresh one once
+        with _hash_pool_lock:
+            if _hash_pool is pool:
+                _hash_pool = None
+        return work(hash_pool())
+
+
+def run_hashing(fn, *args):
+    return with_hash_pool(lambda pool: pool.submit(fn, *args).result())
+
 
-@app.route('/')
+def hash_password(password):
+    return run_hashing(generate_password_hash, password)
+
+
+def hash_passwords(passwords):
+    passwords = list(passwords)
+    if not passwords:
+        return []
+    workers = min(BULK_HASH_WORKERS, len(passwords))
+    chunksize = max(1, len(passwords) // (workers * 4))
+
+    def hash_batch():
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('forkserver')) as pool:
+            return list(pool.map(generate_password_hash, passwords, chunksize=chunksize))
+    try:
+        return hash_batch()
+    except BrokenProcessPool:
+        # a killed child breaks the batch's pool; hash it again once
+        return hash_batch()
+
+
+def verify_password(pwhash, password):
+    return run_hashing(check_password_hash, pwhash, password)
+
+
+def after_fork():
+    # called from gunicorn's post_fork: nothing process-bound may be
+    # shared between workers forked from a preloaded master
+    global _hash_pool, _hash_pool_lock
+    db_pool.reset()
+    for pool in replica_pools:
+        pool.reset()
+    _hash_pool = None
+    _hash_pool_lock = threading.Lock()
+    db_pool.prime(DB_POOL_PRIME)
+
+
+@route('/')
 def index():
     if 'user_id' in session:
         if session.get('role') == 'head' or session.get('role') == 'admin':
@@ -135,36 +989,42 @@ def index():
     else:
         return redirect(url_for('login'))
 
-@app.route('/create_admin_user')
+@route('/create_admin_user')
 def admin_page():
     conn = get_db_connection()
 
     # Create admin user if not exists
     admin_exists = conn.execute('SELECT 1 FROM users WHERE username = ?', ('admin',)).fetchone()
     if not admin_exists:
+        dept_id = ensure_department(conn, 'Medical Education')
         conn.execute(
-            'INSERT INTO users (username, password, role, full_name,department) VALUES (?, ?, ?, ?, ?)',
-            ('admin', generate_password_hash('admin123'), 'admin', 'Administrator','Medical Education')
+            'INSERT INTO users (username, password, role, full_name,department_id) VALUES (?, ?, ?, ?, ?)',
+            ('admin', hash_password('admin123'), 'admin', 'Administrator', dept_id)
         )
+        bump_department_versions(conn, 'users', [dept_id])
     conn.commit()
-    conn.close()
     return render_template('page-404.html',errmsg='Admin user created with username "admin" and password "admin123". Please change the password after logging in.')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
         
         conn = get_db_connection()
-        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
+        user = conn.execute('''
+            SELECT users.*, departments.name AS department
+            FROM users
+            JOIN departments ON users.department_id = departments.id
+            WHERE username = ?
+        ''', (username,)).fetchone()
         
-        if user and check_password_hash(user['password'], password):
+        if user and verify_password(user['password'], password):
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['role'] = user['role']
             session['department'] = user['department']
+            session['department_id'] = user['department_id']
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
         else:
@@ -172,43 +1032,47 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/temp_data')
+@route('/temp_data')
+@query_budget()
 def temp_data():
     users_data=[
-        ('ahmed1', generate_password_hash('1234'), 'Medical Education', 'head', 'ahmed mohamed'),
-        ('mohamed1', generate_password_hash('1234'), 'Medical Education', 'user', 'mohamed mohamed'),
-        ('sara1', generate_password_hash('1234'), 'Medical Education', 'user', 'sara mohamed'),
-        ('laila1', generate_password_hash('1234'), 'Medical Education', 'user', 'laila mohamed'),
-        ('yara1', generate_password_hash('1234'), 'Research', 'head', 'yara mohamed'),
-        ('omar1', generate_password_hash('1234'), 'Research', 'user', 'omar mohamed'),
-        ('nour1', generate_password_hash('1234'), 'Research', 'user', 'nour mohamed'),
-        ('salma1', generate_password_hash('1234'), 'Histology', 'head', 'salma mohamed'),
-        ('khaled1', generate_password_hash('1234'), 'Histology', 'user', 'khaled mohamed'),
-        ('dina1', generate_password_hash('1234'), 'Histology', 'user', 'dina mohamed'),
-        ('ahmed2', generate_password_hash('1234'), 'Biochemistry', 'head', 'ahmed mohamed'),
-        ('mohamed2', generate_password_hash('1234'), 'Biochemistry', 'user', 'mohamed mohamed'),
-        ('sara2', generate_password_hash('1234'), 'Anatomy', 'head', 'sara mohamed'),
-        ('laila2', generate_password_hash('1234'), 'Anatomy', 'user', 'laila mohamed'),
-        ('yara2', generate_password_hash('1234'), 'Anatomy', 'user', 'yara mohamed'),
-        ('omar2', generate_password_hash('1234'), 'Biochemistry', 'user', 'omar mohamed'),
-        ('nour2', generate_password_hash('1234'), 'Medicine', 'head', 'nour mohamed'),
-        ('salma2', generate_password_hash('1234'), 'Medicine', 'user', 'salma mohamed'),
-        ('khaled2', generate_password_hash('1234'), 'Medicine', 'user', 'khaled mohamed'),
-        ('dina2', generate_password_hash('1234'), 'Biochemistry', 'user', 'dina mohamed')
+        ('ahmed1', '1234', 'Medical Education', 'head', 'ahmed mohamed'),
+        ('mohamed1', '1234', 'Medical Education', 'user', 'mohamed mohamed'),
+        ('sara1', '1234', 'Medical Education', 'user', 'sara mohamed'),
+        ('laila1', '1234', 'Medical Education', 'user', 'laila mohamed'),
+        ('yara1', '1234', 'Research', 'head', 'yara mohamed'),
+        ('omar1', '1234', 'Research', 'user', 'omar mohamed'),
+        ('nour1', '1234', 'Research', 'user', 'nour mohamed'),
+        ('salma1', '1234', 'Histology', 'head', 'salma mohamed'),
+        ('khaled1', '1234', 'Histology', 'user', 'khaled mohamed'),
+        ('dina1', '1234', 'Histology', 'user', 'dina mohamed'),
+        ('ahmed2', '1234', 'Biochemistry', 'head', 'ahmed mohamed'),
+        ('mohamed2', '1234', 'Biochemistry', 'user', 'mohamed mohamed'),
+        ('sara2', '1234', 'Anatomy', 'head', 'sara mohamed'),
+        ('laila2', '1234', 'Anatomy', 'user', 'laila mohamed'),
+        ('yara2', '1234', 'Anatomy', 'user', 'yara mohamed'),
+        ('omar2', '1234', 'Biochemistry', 'user', 'omar mohamed'),
+        ('nour2', '1234', 'Medicine', 'head', 'nour mohamed'),
+        ('salma2', '1234', 'Medicine', 'user', 'salma mohamed'),
+        ('khaled2', '1234', 'Medicine', 'user', 'khaled mohamed'),
+        ('dina2', '1234', 'Biochemistry', 'user', 'dina mohamed')
     ]
     conn = get_db_connection()
-    
+    hashes = hash_passwords(password for _, password, _, _, _ in users_data)
+    users_data = [(username, pwhash, ensure_department(conn, department), role, full_name)
+                  for (username, _, department, role, full_name), pwhash in zip(users_data, hashes)]
 
     conn.executemany(
-        'INSERT INTO users (username, password, department,role, full_name) VALUES (?, ?, ?, ?, ?)',
+        'INSERT INTO users (username, password, department_id,role, full_name) VALUES (?, ?, ?, ?, ?)',
         users_data
     )
+    bump_department_versions(conn, 'users', {dept_id for _, _, dept_id, _, _ in users_data})
     conn.commit()
-    conn.close()
+    kpi_cache.clear()
     return render_template('page-404.html',errmsg='data added successfully! Please log in.')
 
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -222,54 +1086,30 @@ def register():
         else:
             conn = get_db_connection()
             try:
+                dept_id = ensure_department(conn, department)
                 conn.execute(
-                    'INSERT INTO users (username, password, full_name, department,role) VALUES (?, ?, ?, ?,?)',
-                    (username, generate_password_hash(password), full_name, department, role)
+                    'INSERT INTO users (username, password, full_name, department_id,role) VALUES (?, ?, ?, ?,?)',
+                    (username, hash_password(password), full_name, dept_id, role)
                 )
+                bump_department_versions(conn, 'users', [dept_id])
                 conn.commit()
+                kpi_cache.invalidate(department)
                 flash('Registration successful! Please log in.', 'success')
                 return redirect(url_for('login'))
             except pymysql.err.IntegrityError:
+                conn.rollback()
                 flash('Username already exists', 'danger')
-            finally:
-                conn.close()
     
     return render_template('register.html')
 
 
-    if request.method == 'POST':
-        username = request.form['username']
-        password = request.form['password']
-        full_name = request.form['full_name']
-        department = request.form['department']
-        role = request.form['role']
-        
-        if not username or not password:
-            flash('Username and password are required', 'danger')
-        else:
-            conn = get_db_connection()
-            try:
-                conn.execute(
-                    'INSERT INTO users (username, password, full_name, department,role) VALUES (?, ?, ?, ?,?)',
-                    (username, generate_password_hash(password), full_name, department, role)
-                )
-                conn.commit()
-                flash('Registration successful! Please log in.', 'success')
-                return redirect(url_for('login'))
-            except pymysql.err.IntegrityError:
-                flash('Username already exists', 'danger')
-            finally:
-                conn.close()
-    
-    return render_template('register.html')
-
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
-@app.route('/semester_add', methods=['GET', 'POST'])
+@route('/semester_add', methods=['GET', 'POST'])
 @login_required
 def semester_data():
     if request.method == 'POST':
@@ -296,8 +1136,9 @@ def semester_data():
                 
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?,? )
         ''', tuple(data.values()))
+        bump_data_versions(conn, 'academic_data', [session['user_id']])
         conn.commit()
-        conn.close()
+        kpi_cache.invalidate(session['department'])
 
         flash('Data added successfully!', 'success')
         return redirect(url_for('view_person',id=session['user_id']))
@@ -306,7 +1147,7 @@ def semester_data():
 
 
 
-@app.route('/Scientific_production', methods=['GET', 'POST'])
+@route('/Scientific_production', methods=['GET', 'POST'])
 @login_required
 def Scientific_production_data():
     if request.method == 'POST':
@@ -324,17 +1165,16 @@ def Scientific_production_data():
                     user_id, Scientific_research, supervision_Graduation
                 ) VALUES (?, ?, ?)
             ''', tuple(data.values()))
+            bump_data_versions(conn, 'Scientific_production', [session['user_id']])
             conn.commit()
             flash('Data added successfully!', 'success')
             return redirect(url_for('view_person',id=session['user_id']))
         except:
             return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')
-        finally:
-            conn.close() 
 
     return render_template('Scientific_production.html')
 
-@app.route('/cirteria_add', methods=['GET', 'POST'])
+@route('/cirteria_add', methods=['GET', 'POST'])
 @login_required
 def cirteria_data():
     if request.method == 'POST':
@@ -369,16 +1209,15 @@ def cirteria_data():
                     Methods_student,preparing_test_questions,Provide_academic_guidance,aspects_sum
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', tuple(data.values()))
+            bump_data_versions(conn, 'Evaluation_aspects', [session['user_id']])
             conn.commit() 
         except:
             return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')        
-        finally:
-            conn.close() 
         return redirect(url_for('view_person',id=session['user_id']))
 
     return render_template('criteria_of_evaluation.html')
 
-@app.route('/ethical_add', methods=['GET', 'POST'])
+@route('/ethical_add', methods=['GET', 'POST'])
 @login_required
 def ethical_data():
     if request.method == 'POST':
@@ -411,68 +1250,235 @@ def ethical_data():
             punctuality, office_hours,aspects_sum
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', tuple(data.values()))
+            bump_data_versions(conn, 'ethics_responsibility', [session['user_id']])
             conn.commit()
         except:
             return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')
-        finally:
-            conn.close()
 
         return redirect(url_for('view_person',id=session['user_id']))
 
     return render_template('EthicsResponsibility_add.html')
 
-@app.route('/update/ethical/<int:id>', methods=['GET', 'POST'])
+# Head/admin evaluations. A submission fills this year's row of one table
+# with a single conditional UPDATE that only matches a row nobody has
+# evaluated yet, so two heads racing on the same person cannot both win.
+# rowcount decides the outcome; only a miss costs a second query, to tell
+# "already evaluated" from "nothing to evaluate".
+# table -> ([(form field, max score)], sum column or None, column that is NULL until evaluated)
+EVALUATIONS = {
+    'Scientific_production': ([('Scientific_research_Evaluation', 10), ('supervision_Graduation_Evaluation', 10)],
+                              None, 'supervision_Graduation_Evaluation'),
+    'university_evaluation': ([('department_load_Evaluation', 5), ('workshop_develop_Evaluation', 5),
+                               ('medical_services_Evaluation', 5), ('program_bank_Evaluation', 5)],
+                              'evaluation_sum', 'evaluation_sum'),
+    'Evaluation_aspects': ([('Develop_courses_Evaluation', 5), ('Prepare_file_Evaluation', 5),
+                            ('Electronic_tests_Evaluation', 5), ('Prepare_material_Evaluation', 5),
+                            ('Use_learning_Evaluation', 5), ('teaching_methods_Evaluation', 5),
+                            ('Methods_student_Evaluation', 5), ('preparing_test_Evaluation', 5),
+                            ('Provide_academic_Evaluation', 5)],
+                           'evaluation_sum', 'evaluation_sum'),
+    'ethics_responsibility': ([('professional_values_evaluation', 2), ('offer_encouragement_evaluation', 2),
+                               ('respect_leaders_evaluation', 2), ('take_responsibility_evaluation', 2),
+                               ('decent_appearance_evaluation', 2), ('punctuality_evaluation', 2),
+                               ('office_hours_evaluation', 3)],
+                              'evaluation_sum', 'evaluation_sum'),
+}
+EVALUATED, ALREADY_EVALUATED, NOTHING_TO_EVALUATE = 'evaluated', 'already evaluated', 'nothing to evaluate'
+EVALUATION_MESSAGES = {
+    ALREADY_EVALUATED: ' لقد قمت بالتقييم بالفعل هذا العام ❌',
+    NOTHING_TO_EVALUATE: ' لا يوجد تقييم ذاتي لهذا العام لتقييمه ❌',
+}
+
+
+class InvalidEvaluation(Exception):
+    pass
+
+
+def evaluation_scores(table, form, prefix=''):
+    # whole numbers within each field's maximum, in EVALUATIONS order
+    scores = []
+    for field, maximum in EVALUATIONS[table][0]:
+        value = (form.get(prefix + field) or '').strip()
+        if not value.isdigit() or int(value) > maximum:
+            raise InvalidEvaluation('%s: أدخل رقما صحيحا من 0 إلى %d ❌' % (field, maximum))
+        scores.append(int(value))
+    return scores
+
+
+def evaluation_update(table):
+    fields, sum_column, pending = EVALUATIONS[table]
+    assignments = ['%s = ?' % field for field, _ in fields]
+    if sum_column:
+        assignments.append('%s = ?' % sum_column)
+    return 'UPDATE %s SET %s WHERE user_id = ? AND evaluation_year = ? AND %s IS NULL' % (
+        table, ', '.join(assignments), pending)
+
+
+def evaluation_params(table, user_id, scores, year):
+    total = (sum(scores),) if EVALUATIONS[table][1] else ()
+    return tuple(scores) + total + (user_id, year)
+
+
+# Evaluation rankings: evaluation_rankings holds each person's yearly total
+# over the evaluated sections next to their department, so rankings and
+# percentiles are range scans of idx_evaluation_rankings_rank instead of a
+# four-way aggregate. Every evaluation written recomputes the person's row
+# in the same transaction.
+RANKED_TABLES = ['Evaluation_aspects', 'ethics_responsibility', 'university_evaluation', 'Scientific_production']
+
+
+def evaluation_score(table):
+    fields, sum_column, _ = EVALUATIONS[table]
+    return '%s.%s' % (table, sum_column) if sum_column else ' + '.join('%s.%s' % (table, f) for f, _ in fields)
+
+
+def refresh_rankings(conn, user_ids, year):
+    scores = ' + '.join('COALESCE(%s, 0)' % evaluation_score(table) for table in RANKED_TABLES)
+    sections = ' + '.join('(%s.%s IS NOT NULL)' % (table, EVALUATIONS[table][2]) for table in RANKED_TABLES)
+    joins = ''.join(' LEFT JOIN %s ON %s.user_id = users.id AND %s.evaluation_year = ?' % (table, table, table)
+                    for table in RANKED_TABLES)
+    conn.execute('''
+        REPLACE INTO evaluation_rankings (user_id, evaluation_year, department_id, total, sections)
+        SELECT users.id, ?, users.department_id, %s, %s
+        FROM users%s
+        WHERE users.id IN (%s)
+    ''' % (scores, sections, joins, ', '.join(['?'] * len(user_ids))),
+        (year,) * (len(RANKED_TABLES) + 1) + tuple(user_ids))
+
+
+def rebuild_rankings(conn):
+    # from scratch, for bulk loads (seed) and repairs
+    scores = ' UNION ALL '.join(
+        'SELECT user_id, evaluation_year, %s AS score FROM %s WHERE %s IS NOT NULL'
+        % (evaluation_score(table), table, EVALUATIONS[table][2]) for table in RANKED_TABLES)
+    conn.execute('DELETE FROM evaluation_rankings')
+    return conn.execute('''
+        INSERT INTO evaluation_rankings (user_id, evaluation_year, department_id, total, sections)
+        SELECT scores.user_id, scores.evaluation_year, users.department_id, SUM(scores.score), COUNT(*)
+        FROM (%s) AS scores
+        JOIN users ON users.id = scores.user_id
+        GROUP BY scores.user_id, scores.evaluation_year, users.department_id
+    ''' % scores).rowcount
+
+
+def apply_evaluation(conn, table, user_id, scores, year=None):
+    year = year or current_year()
+    cursor = conn.execute(evaluation_update(table), evaluation_params(table, user_id, scores, year))
+    if cursor.rowcount == 1:
+        bump_data_versions(conn, table, [user_id])
+        refresh_rankings(conn, [user_id], year)
+        return EVALUATED
+    exists = conn.execute('SELECT 1 FROM %s WHERE user_id = ? AND evaluation_year = ?' % table,
+                          (user_id, year)).fetchone()
+    return ALREADY_EVALUATED if exists else NOTHING_TO_EVALUATE
+
+
+def submit_evaluation(table, user_id):
+    try:
+        scores = evaluation_scores(table, request.form)
+    except InvalidEvaluation as e:
+        return render_template('page-404.html', error_msg=str(e))
+    conn = get_db_connection()
+    outcome = apply_evaluation(conn, table, user_id, scores)
+    if outcome != EVALUATED:
+        conn.rollback()
+        return render_template('page-404.html', error_msg=EVALUATION_MESSAGES[outcome])
+    conn.commit()
+    kpi_cache.clear()
+    flash('Data added successfully!', 'success')
+    return redirect(url_for('view_person', id=user_id))
+
+
+# Bulk evaluation grid: a head scores the whole department on one page.
+# Pending rows come from one query per table; a submission is validated as
+# a whole and then written with one executemany per table in a single
+# transaction. Rows left blank stay pending.
+# table -> (section title, self-evaluation columns shown next to each person)
+EVALUATION_GRID = {
+    'university_evaluation': ('خدمة القسم و الكلية و الجامعة و المجتمع', ['aspects_sum']),
+    'Scientific_production': ('الانتاج العلمي والانشطة العلمية والمهنية', ['Scientific_research', 'supervision_Graduation']),
+    'Evaluation_aspects': ('جوانب و معايير التقييم و مؤشرات الأداء', ['aspects_sum']),
+    'ethics_responsibility': ('الأخلاقيات والمسؤولية المهنية', ['aspects_sum']),
+}
+
+
+def pending_evaluations(conn, dept_id, year):
+    pending = {}
+    for table, (_, self_columns) in EVALUATION_GRID.items():
+        pending[table] = conn.execute('''
+            SELECT %s.user_id, users.username, users.full_name, %s
+            FROM %s
+            JOIN users ON %s.user_id = users.id
+            WHERE users.department_id = ? AND %s.evaluation_year = ? AND %s.%s IS NULL
+            ORDER BY users.full_name, users.id
+        ''' % (table, ', '.join('%s.%s' % (table, column) for column in self_columns), table, table,
+               table, table, EVALUATIONS[table][2]), (dept_id, year)).fetchall()
+    return pending
+
+
+def grid_field(table, user_id, field=''):
+    return '%s:%d:%s' % (table, user_id, field)
+
+
+def grid_submission(pending, form):
+    # (table -> [(user_id, scores)], [(person, error)]) for the filled-in rows
+    batches = {}
+    errors = []
+    for table, rows in pending.items():
+        for row in rows:
+            prefix = grid_field(table, row['user_id'])
+            if not any((form.get(prefix + field) or '').strip() for field, _ in EVALUATIONS[table][0]):
+                continue
+            try:
+                batches.setdefault(table, []).append((row['user_id'], evaluation_scores(table, form, prefix)))
+            except InvalidEvaluation as e:
+                errors.append((row['full_name'] or row['username'], str(e)))
+    return batches, errors
+
+
+def apply_evaluations(conn, batches, year):
+    # rows another head evaluated since the page was loaded no longer match
+    # the UPDATE and come back as skipped
+    applied = submitted = 0
+    for table, entries in batches.items():
+        cursor = conn.executemany(evaluation_update(table),
+                                  [evaluation_params(table, user_id, scores, year) for user_id, scores in entries])
+        applied += cursor.rowcount
+        submitted += len(entries)
+        bump_data_versions(conn, table, [user_id for user_id, _ in entries])
+    refresh_rankings(conn, sorted({user_id for entries in batches.values() for user_id, _ in entries}), year)
+    return applied, submitted - applied
+
+
+@route('/evaluate/department', methods=['GET', 'POST'])
+@login_required
+def evaluate_department():
+    if session.get('role') != 'head':
+        return render_template('page-404.html', error_msg='Page Not Found')
+    conn = get_db_connection()
+    year = current_year()
+    pending = pending_evaluations(conn, session_department_id(), year)
+    result = {}
+    if request.method == 'POST':
+        batches, errors = grid_submission(pending, request.form)
+        if errors:
+            result = {'errors': errors, 'form': request.form}
+        elif batches:
+            applied, skipped = apply_evaluations(conn, batches, year)
+            conn.commit()
+            kpi_cache.clear()
+            pending = pending_evaluations(conn, session_department_id(), year)
+            result = {'applied': applied, 'skipped': skipped}
+    return render_template('admin/evaluate_department.html', department=session['department'], pending=pending,
+                           grid=EVALUATION_GRID, evaluations=EVALUATIONS, field_name=grid_field, **result)
+
+
+@route('/update/ethical/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update_ethical(id):
     if session.get('role') == 'head':
         if request.method == 'POST':
-            # Get form data 
-          
-            professional_values_evaluation= request.form['professional_values_evaluation']
-            offer_encouragement_evaluation= request.form['offer_encouragement_evaluation']
-            respect_leaders_evaluation= request.form['respect_leaders_evaluation']
-            take_responsibility_evaluation= request.form['take_responsibility_evaluation']
-            decent_appearance_evaluation= request.form['decent_appearance_evaluation']
-            punctuality_evaluation= request.form['punctuality_evaluation']
-            office_hours_evaluation= request.form['office_hours_evaluation']
-           
-            evaluation_fields = [
-            'professional_values_evaluation',
-            'offer_encouragement_evaluation',
-            'respect_leaders_evaluation',
-            'take_responsibility_evaluation',
-            'decent_appearance_evaluation',
-            'punctuality_evaluation',
-            'office_hours_evaluation',
-             ]
-
-            # Calculate sum with error handling
-            try:
-                evaluation_sum = sum(int(request.form[field]) for field in evaluation_fields)
-            except ValueError as e:
-                # Handle case where a value can't be converted to int
-                evaluation_sum = 0  # or raise an exception
-                print(f"Error converting form values: {e}")
-
-            # Insert into database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-
-            update_query = ''' UPDATE ethics_responsibility SET professional_values_evaluation == ?,
-            offer_encouragement_evaluation == ?, respect_leaders_evaluation == ? ,
-            take_responsibility_evaluation == ?, decent_appearance_evaluation == ?,
-            punctuality_evaluation == ?, office_hours_evaluation == ?,
-            evaluation_sum == ? 
-            WHERE ethics_responsibility.user_id == ? '''
-
-            cursor.execute(update_query, (professional_values_evaluation,offer_encouragement_evaluation,
-            respect_leaders_evaluation,take_responsibility_evaluation,
-            decent_appearance_evaluation,punctuality_evaluation,
-            office_hours_evaluation,evaluation_sum,id))
-            conn.commit()
-            conn.close()
-            flash('Data added successfully!', 'success')
-            return redirect(url_for('view_person',id=id))
+            return submit_evaluation('ethics_responsibility', id)
 
         conn = get_db_connection()
 
@@ -484,14 +1490,13 @@ def update_ethical(id):
             WHERE ethics_responsibility.user_id = ?
             
         ''',(id,)).fetchone()
-        conn.close()
 
         return render_template('admin/ethic_responsibility_evaluation.html',id=id, ethics_responsibility=ethics_responsibility)
     else:
         return render_template('page-404.html', error_msg='Page Not Found')
 
 
-@app.route('/university_evaluation', methods=['GET', 'POST'])
+@route('/university_evaluation', methods=['GET', 'POST'])
 @login_required
 def university_evaluation():
     if request.method == 'POST':
@@ -518,11 +1523,10 @@ def university_evaluation():
                     medical_services,aspects_sum
                 ) VALUES (?, ?, ?, ?, ?, ?)
             ''', tuple(data.values()))
+            bump_data_versions(conn, 'university_evaluation', [session['user_id']])
             conn.commit()
         except:
             return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')
-        finally:
-            conn.close()
 
         return redirect(url_for('view_person',id=session['user_id']))
 
@@ -530,7 +1534,7 @@ def university_evaluation():
 
 
 
-@app.route('/prticipation_add', methods=['GET', 'POST'])
+@route('/prticipation_add', methods=['GET', 'POST'])
 @login_required
 def prticipation_data():
     if request.method == 'POST':
@@ -550,15 +1554,16 @@ def prticipation_data():
                 user_id, location, type_part, place, year
             ) VALUES (?, ?, ?, ?, ? )
         ''', tuple(data.values()))
+        bump_data_versions(conn, 'participate_conference', [session['user_id']])
         conn.commit()
-        conn.close()
+        kpi_cache.invalidate(session['department'])
 
         flash('Data added successfully!', 'success')
         return redirect(url_for('view_person',id=session['user_id']))
 
     return render_template('Participation_in_conferences.html')
 
-@app.route('/university', methods=['GET', 'POST'])
+@route('/university', methods=['GET', 'POST'])
 @login_required
 def University_Service():
     if request.method == 'POST':
@@ -577,8 +1582,9 @@ def University_Service():
                 user_id, task_level, task_type, notes
             ) VALUES (?, ?, ?, ? )
         ''', tuple(data.values()))
+        bump_data_versions(conn, 'University_Service', [session['user_id']])
         conn.commit()
-        conn.close()
+        kpi_cache.invalidate(session['department'])
 
         flash('Data added successfully!', 'success')
         return redirect(url_for('view_person',id=session['user_id']))
@@ -586,7 +1592,7 @@ def University_Service():
     return render_template('University_Service.html')
 
 
-@app.route('/activity_add', methods=['GET', 'POST'])
+@route('/activity_add', methods=['GET', 'POST'])
 @login_required
 def activity_data():
     if request.method == 'POST':
@@ -607,8 +1613,9 @@ def activity_data():
                 user_id, activity_title, activity_date, duration, participation_type, place
             ) VALUES (?, ?, ?, ?, ?, ? )
         ''', tuple(data.values()))
+        bump_data_versions(conn, 'activity_data', [session['user_id']])
         conn.commit()
-        conn.close()
+        kpi_cache.invalidate(session['department'])
 
         flash('Data added successfully!', 'success')
         return redirect(url_for('view_person',id=session['user_id']))
@@ -617,7 +1624,24 @@ def activity_data():
 
 
 
-@app.route('/program_add', methods=['GET', 'POST'])
+# Research classification, decided once at insert time and stored in small
+# indexed columns so the KPI counts are equality lookups, not LIKE scans.
+RESEARCH_OTHER, RESEARCH_PAPER = 0, 1
+PUBLISHER_OTHER, PUBLISHER_CONFERENCE, PUBLISHER_JOURNAL = 0, 1, 2
+
+
+def classify_research(research_type, publisher):
+    research_category = RESEARCH_PAPER if research_type and 'بحث' in research_type else RESEARCH_OTHER
+    if publisher and 'مجلة' in publisher:
+        publisher_category = PUBLISHER_JOURNAL
+    elif publisher and 'مؤتمر' in publisher:
+        publisher_category = PUBLISHER_CONFERENCE
+    else:
+        publisher_category = PUBLISHER_OTHER
+    return research_category, publisher_category
+
+
+@route('/program_add', methods=['GET', 'POST'])
 @login_required
 def program_data():
     if request.method == 'POST':
@@ -632,112 +1656,338 @@ def program_data():
             'research_type': request.form['research_type'],
             'DOI': request.form['DOI']
         }
+        data['research_category'], data['publisher_category'] = classify_research(data['research_type'], data['Publisher'])
 
         # Insert into database
         conn = get_db_connection()
         conn.execute('''
             INSERT INTO Scientific_research (
                 user_id, scientific_output, Authors_names, Publisher, Agency,
-                year, research_type, DOI
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                year, research_type, DOI, research_category, publisher_category
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', tuple(data.values()))
+        bump_data_versions(conn, 'Scientific_research', [session['user_id']])
         conn.commit()
-        conn.close()
+        kpi_cache.invalidate(session['department'])
 
         flash('Data added successfully!', 'success')
         return redirect(url_for('view_person',id=session['user_id']))
 
     return render_template('add_program.html')
 
-@app.route('/view')
+# Bulk import: an uploaded CSV/XLSX is validated row by row as it is read,
+# valid rows go in through batched executemany inside one transaction and
+# every rejected row is reported back with its line number.
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_ERRORS = 200
+IMPORT_TARGETS = {
+    'academic_data': {
+        'columns': ['semester', 'course_code', 'num_students', 'teaching_load', 'course_name',
+                    'semester_type', 'credit_hours', 'd2l', 'QuestionMark'],
+        'required': ['semester', 'course_code'],
+        'integers': ['num_students', 'credit_hours'],
+        'lengths': {'semester': 100, 'course_code': 100, 'teaching_load': 255, 'course_name': 255,
+                    'semester_type': 50, 'd2l': 255, 'QuestionMark': 255},
+    },
+    'Scientific_research': {
+        'columns': ['scientific_output', 'Authors_names', 'Publisher', 'Agency', 'year', 'research_type', 'DOI'],
+        'required': ['scientific_output'],
+        'integers': [],
+        'lengths': {'year': 20},
+        'derived': (['research_category', 'publisher_category'],
+                    lambda record: classify_research(record.get('research_type'), record.get('Publisher'))),
+    },
+}
+
+
+class InvalidImportRow(Exception):
+    pass
+
+
+def import_value(target, column, value):
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == '':
+        if column in target['required']:
+            raise InvalidImportRow('%s is required' % column)
+        return None
+    if column in target['integers']:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise InvalidImportRow('%s must be a number' % column)
+        if not number.is_integer():
+            raise InvalidImportRow('%s must be a whole number' % column)
+        return int(number)
+    value = str(value)
+    limit = target['lengths'].get(column)
+    if limit and len(value) > limit:
+        raise InvalidImportRow('%s is longer than %d characters' % (column, limit))
+    return value
+
+
+def import_owners(conn, usernames):
+    # username -> id for one batch, limited to the importer's reach
+    if session.get('role') == 'user' or not usernames:
+        return {}
+    query = 'SELECT id, username FROM users WHERE username IN (%s)' % ', '.join(['?'] * len(usernames))
+    params = tuple(usernames)
+    if session.get('role') == 'head':
+        query += ' AND department_id = ?'
+        params += (session_department_id(),)
+    return {row['username']: row['id'] for row in conn.execute(query, params).fetchall()}
+
+
+def import_rows(conn, table, rows):
+    target = IMPORT_TARGETS[table]
+    header = next(rows, None) or []
+    positions = {str(name).strip(): i for i, name in enumerate(header) if name is not None}
+    missing = [column for column in target['required'] if column not in positions]
+    if missing:
+        return 0, [(1, 'missing columns: ' + ', '.join(missing))]
+    columns = [column for column in target['columns'] if column in positions]
+    derived_columns, derive = target.get('derived', ([], None))
+    insert_columns = columns + derived_columns
+    insert = 'INSERT INTO %s (user_id, %s) VALUES (?, %s)' % (
+        table, ', '.join(insert_columns), ', '.join(['?'] * len(insert_columns)))
+    inserted = 0
+    errors = []
+    batch = []
+
+    def report(line, message):
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append((line, message))
+
+    def flush():
+        owners = import_owners(conn, {username for _, username, _ in batch if username})
+        params = []
+        for line, username, record in batch:
+            if not username or (session.get('role') == 'user' and username == session['username']):
+                params.append((session['user_id'],) + record)
+            elif username in owners:
+                params.append((owners[username],) + record)
+            else:
+                report(line, 'unknown user %s' % username)
+        if params:
+            conn.executemany(insert, params)
+            bump_data_versions(conn, table, [record[0] for record in params])
+        batch.clear()
+        return len(params)
+
+    for line, values in enumerate(rows, start=2):
+        if all(value is None or str(value).strip() == '' for value in values):
+            continue
+        cells = {column: values[i] for column, i in positions.items() if i < len(values)}
+        try:
+            record = tuple(import_value(target, column, cells.get(column)) for column in columns)
+        except InvalidImportRow as e:
+            report(line, str(e))
+            continue
+        if derive:
+            record += tuple(derive(dict(zip(columns, record))))
+        username = str(cells.get('username') or '').strip() or None
+        batch.append((line, username, record))
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            inserted += flush()
+    if batch:
+        inserted += flush()
+    return inserted, sorted(errors)
+
+
+@route('/import', methods=['GET', 'POST'])
+@login_required
+@query_budget()
+def import_data():
+    if request.method == 'POST':
+        table = request.form.get('table')
+        upload = request.files.get('file')
+        if table not in IMPORT_TARGETS or not upload or not upload.filename:
+            flash('Please choose what to import and a CSV or Excel file', 'danger')
+            return render_template('import.html', targets=IMPORT_TARGETS)
+        rows = xlsx_rows(upload.stream) if upload.filename.lower().endswith('.xlsx') else csv_rows(upload.stream)
+        conn = get_db_connection()
+        try:
+            inserted, errors = import_rows(conn, table, iter(rows))
+            conn.commit()
+        except (zipfile.BadZipFile, UnicodeDecodeError, ElementTree.ParseError, ValueError, csv.Error):
+            conn.rollback()
+            return render_template('import.html', targets=IMPORT_TARGETS, failed='الملف غير صالح ❌')
+        except pymysql.err.MySQLError as e:
+            conn.rollback()
+            return render_template('import.html', targets=IMPORT_TARGETS, failed=str(e))
+        if inserted:
+            if session.get('role') == 'admin':
+                kpi_cache.clear()
+            else:
+                kpi_cache.invalidate(session['department'])
+        return render_template('import.html', targets=IMPORT_TARGETS, table=table, inserted=inserted, errors=errors)
+
+    return render_template('import.html', targets=IMPORT_TARGETS)
+
+
+# Roster provisioning: an admin uploads one CSV/XLSX of accounts, rows are
+# validated as they are read, every password is hashed across the hashing
+# pool in one go and the accounts go in with a single executemany.
+ROSTER_TARGET = {
+    'columns': ['username', 'password', 'full_name', 'department', 'role'],
+    'required': ['username', 'password', 'department'],
+    'integers': [],
+    'lengths': {'username': 255, 'full_name': 255, 'department': 255, 'role': 50},
+}
+ROSTER_ROLES = ('user', 'head', 'admin')
+
+
+def roster_accounts(conn, rows):
+    header = next(rows, None) or []
+    positions = {str(name).strip(): i for i, name in enumerate(header) if name is not None}
+    missing = [column for column in ROSTER_TARGET['required'] if column not in positions]
+    if missing:
+        return [], [(1, 'missing columns: ' + ', '.join(missing))]
+    accounts = []
+    errors = []
+    seen = set()
+    for line, values in enumerate(rows, start=2):
+        if all(value is None or str(value).strip() == '' for value in values):
+            continue
+        cells = {column: values[i] for column, i in positions.items() if i < len(values)}
+        try:
+            username, password, full_name, department, role = (
+                import_value(ROSTER_TARGET, column, cells.get(column)) for column in ROSTER_TARGET['columns'])
+        except InvalidImportRow as e:
+            errors.append((line, str(e)))
+            continue
+        role = role or 'user'
+        if role not in ROSTER_ROLES:
+            errors.append((line, 'role must be one of ' + ', '.join(ROSTER_ROLES)))
+        elif username in seen:
+            errors.append((line, 'duplicate username %s' % username))
+        else:
+            seen.add(username)
+            accounts.append((line, username, password, full_name, department, role))
+
+    # drop usernames that are already taken before spending time hashing
+    taken = set()
+    names = [account[1] for account in accounts]
+    for start in range(0, len(names), IMPORT_BATCH_SIZE):
+        chunk = names[start:start + IMPORT_BATCH_SIZE]
+        taken.update(row['username'] for row in conn.execute(
+            'SELECT username FROM users WHERE username IN (%s)' % ', '.join(['?'] * len(chunk)),
+            tuple(chunk)).fetchall())
+    for line, username, *_ in accounts:
+        if username in taken:
+            errors.append((line, 'username %s already exists' % username))
+    accounts = [account for account in accounts if account[1] not in taken]
+    return accounts, sorted(errors)[:IMPORT_MAX_ERRORS]
+
+
+@route('/import/users', methods=['GET', 'POST'])
+@login_required
+@query_budget()
+def import_users():
+    if session.get('role') != 'admin':
+        return render_template('page-404.html', error_msg='Access denied')
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or Excel file', 'danger')
+            return render_template('import_users.html', columns=ROSTER_TARGET['columns'])
+        rows = xlsx_rows(upload.stream) if upload.filename.lower().endswith('.xlsx') else csv_rows(upload.stream)
+        conn = get_db_connection()
+        try:
+            accounts, errors = roster_accounts(conn, iter(rows))
+            if accounts:
+                hashes = hash_passwords(password for _, _, password, _, _, _ in accounts)
+                params = [(username, pwhash, full_name, ensure_department(conn, department), role)
+                          for (_, username, _, full_name, department, role), pwhash in zip(accounts, hashes)]
+                conn.executemany(
+                    'INSERT INTO users (username, password, full_name, department_id, role) VALUES (?, ?, ?, ?, ?)',
+                    params
+                )
+                bump_department_versions(conn, 'users', {dept_id for _, _, _, dept_id, _ in params})
+            conn.commit()
+        except (zipfile.BadZipFile, UnicodeDecodeError, ElementTree.ParseError, ValueError, csv.Error):
+            conn.rollback()
+            return render_template('import_users.html', columns=ROSTER_TARGET['columns'], failed='الملف غير صالح ❌')
+        except pymysql.err.MySQLError as e:
+            conn.rollback()
+            return render_template('import_users.html', columns=ROSTER_TARGET['columns'], failed=str(e))
+        if accounts:
+            kpi_cache.clear()
+        return render_template('import_users.html', columns=ROSTER_TARGET['columns'],
+                               inserted=len(accounts), errors=errors)
+
+    return render_template('import_users.html', columns=ROSTER_TARGET['columns'])
+
+
+@route('/view')
+@read_only
 @login_required
 def view_data():
     conn = get_db_connection()
     
     if session.get('role') == 'admin':
         # Admin can see all data
-        semseters = conn.execute('''
+        semseters, semesters_next = keyset_page(conn, '''
             SELECT academic_data.*, users.username, users.full_name 
             FROM academic_data 
             JOIN users ON academic_data.user_id = users.id
-            ORDER BY academic_data.created_at DESC
-        ''').fetchall()
-        activity = conn.execute('''
-            SELECT activity_data.*, users.username, users.full_name 
-            FROM activity_data 
-            JOIN users ON activity_data.user_id = users.id
-            ORDER BY activity_data.created_at DESC
-        ''').fetchall()
+        ''', (), ['academic_data.created_at', 'academic_data.id'], request.args.get('semesters_after'), descending=True)
         
     else:
         # Regular users can only see their own data
-        semseters = conn.execute('''
+        semseters, semesters_next = keyset_page(conn, '''
             SELECT academic_data.*, users.username, users.full_name 
             FROM academic_data 
             JOIN users ON academic_data.user_id = users.id
             WHERE academic_data.user_id = ?
-            ORDER BY academic_data.created_at DESC
-        ''', (session['user_id'],)).fetchall()
-
-        activity = conn.execute('''
-            SELECT activity_data.*, users.username, users.full_name 
-            FROM activity_data 
-            JOIN users ON activity_data.user_id = users.id
-            WHERE activity_data.user_id = ?
-            ORDER BY activity_data.created_at DESC
-        ''', (session['user_id'],)).fetchall()
-    conn.close()
-    return render_template('view_data.html', semseters=semseters,activity=activity)
+        ''', (session['user_id'],), ['academic_data.created_at', 'academic_data.id'], request.args.get('semesters_after'), descending=True)
+    return render_template('view_data.html', semseters=semseters, semesters_next=semesters_next)
 
 
-@app.route('/view/Scientific_production')
+@route('/view/Scientific_production')
+@read_only
 @login_required
 @admin_required
 def view_Scientific_production():
     conn = get_db_connection()
     
     # Admin can see all data
-    Scientific_production = conn.execute('''
+    Scientific_production, next_cursor = keyset_page(conn, '''
         SELECT Scientific_production.*, users.username, users.full_name 
         FROM Scientific_production 
         JOIN users ON Scientific_production.user_id = users.id
-        WHERE users.department = ?
-        ORDER BY Scientific_production.created_at DESC
-    ''', (session['department'],)).fetchall()
+        WHERE users.department_id = ?
+    ''', (session_department_id(),), ['Scientific_production.created_at', 'Scientific_production.id'],
+        request.args.get('after'), descending=True)
 
-    conn.close()
-    return render_template('view_data/view_Scientific_production.html', Scientific_production=Scientific_production)
+    return render_template('view_data/view_Scientific_production.html', Scientific_production=Scientific_production,
+                           next_cursor=next_cursor)
  
-@app.route('/view/criteria_of_evaluation')
+@route('/view/criteria_of_evaluation')
+@read_only
 @login_required
 @admin_required
 def view_criteria_of_evaluation():
     conn = get_db_connection()
     
     # Admin can see all data0
-    Evaluation_aspects = conn.execute('''
-        SELECT aspects_sum,evaluation_sum,user_id, users.username, users.full_name 
+    Evaluation_aspects, next_cursor = keyset_page(conn, '''
+        SELECT Evaluation_aspects.id, Evaluation_aspects.created_at, aspects_sum,evaluation_sum,user_id, users.username, users.full_name 
         FROM Evaluation_aspects 
         JOIN users ON Evaluation_aspects.user_id = users.id
-        WHERE users.department = ?
-        ORDER BY Evaluation_aspects.created_at DESC
-    ''', (session['department'],)).fetchall()
-
-    activity = conn.execute('''
-        SELECT activity_data.*, users.username, users.full_name 
-        FROM activity_data 
-        JOIN users ON activity_data.user_id = users.id
-        WHERE users.department = ?
-        ORDER BY activity_data.created_at DESC
-    ''' , (session['department'],)).fetchall()
-        
-    conn.close()
-    return render_template('view_data/view_criteria.html', Evaluation_aspects=Evaluation_aspects,activity=activity)
+        WHERE users.department_id = ?
+    ''', (session_department_id(),), ['Evaluation_aspects.created_at', 'Evaluation_aspects.id'],
+        request.args.get('after'), descending=True)
+
+    return render_template('view_data/view_criteria.html', Evaluation_aspects=Evaluation_aspects,
+                           next_cursor=next_cursor)
 
 
-@app.route('/view/university_evaluation')
+@route('/view/university_evaluation')
+@read_only
 @login_required
 @admin_required
+@conditional(lambda: [department_scope(session_department_id(), 'university_evaluation')])
 def view_university_evaluation():
     conn = get_db_connection()
     
@@ -747,14 +1997,14 @@ def view_university_evaluation():
         SELECT aspects_sum,evaluation_sum,evaluation_year,user_id, users.username, users.full_name 
         FROM university_evaluation 
         JOIN users ON university_evaluation.user_id = users.id
-        WHERE users.department = ?
+        WHERE users.department_id = ?
         ORDER BY university_evaluation.created_at DESC
         
-    ''', (session['department'],)).fetchall()
-    conn.close()
+    ''', (session_department_id(),)).fetchall()
     return render_template('view_data/view_university.html', university_evaluation=university_evaluation)
 
-@app.route('/view/all_users')
+@route('/view/all_users')
+@read_only
 @login_required
 @admin_required
 def view_all_users():
@@ -762,188 +2012,252 @@ def view_all_users():
     department = request.args.get('department', 'All')
     if department == "All":
         # Admin can see all data0
-        users = conn.execute('''
-            SELECT id, username, department, full_name ,role
+        users, next_cursor = keyset_page(conn, '''
+            SELECT users.id, username, department_id, departments.name AS department, full_name ,role
             FROM users 
+            JOIN departments ON users.department_id = departments.id
             WHERE users.role = 'user' 
-            ORDER BY users.department
-        ''', ).fetchall()
+        ''', (), ['users.department_id', 'users.id'], request.args.get('after'))
+    else:
+        users, next_cursor = keyset_page(conn, '''
+            SELECT users.id, username, departments.name AS department, full_name ,role
+            FROM users 
+            JOIN departments ON users.department_id = departments.id
+            WHERE users.department_id = ? AND users.role = 'user' 
+        ''', (department_id(conn, department),), ['users.id'], request.args.get('after'))
 
-        conn.close()
-        
-        return render_template('view_all_users.html', users=users)
+    return render_template('view_all_users.html', users=users, department=department, next_cursor=next_cursor)
+
+
+# Department exports for accreditation paperwork, streamed straight from an
+# unbuffered cursor into a chunked CSV/XLSX response.
+EXPORT_TABLES = ['academic_data', 'Scientific_research', 'participate_conference', 'Scientific_production',
+                 'Evaluation_aspects', 'ethics_responsibility', 'university_evaluation']
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_department():
+    # heads export their own department, admins any department or all
+    if session.get('role') == 'head':
+        return session['department']
+    department = request.args.get('department', 'All')
+    return None if department == 'All' else department
+
+
+@route('/export')
+@login_required
+@admin_required
+def export_data():
+    return render_template('export.html', tables=EXPORT_TABLES, department=export_department() or 'All')
+
+
+@route('/export/<table>')
+@read_only
+@login_required
+@admin_required
+def export_table(table):
+    fmt = request.args.get('format', 'csv')
+    if table not in EXPORT_TABLES or fmt not in EXPORT_FORMATS:
+        return render_template('page-404.html', error_msg='Page Not Found')
+    department = export_department()
+    query = '''SELECT users.full_name, departments.name AS department, %s.* FROM %s
+        JOIN users ON %s.user_id = users.id
+        JOIN departments ON users.department_id = departments.id''' % (table, table, table)
+    params = ()
+    if department is not None:
+        query += ' WHERE users.department_id = ?'
+        params = (department_id(get_db_connection(), department),)
+    query += ' ORDER BY %s.id' % table
+    def generate():
+        # the connection is taken inside the stream so it stays checked out
+        # until the last chunk is sent
+        columns, batches = get_db_connection().stream(query, params)
+        if fmt == 'xlsx':
+            yield from xlsx_chunks(columns, batches, table)
+        else:
+            yield from csv_chunks(columns, batches)
+
+    filename = '%s-%s.%s' % (table, (department or 'All').replace(' ', '_'), fmt)
+    return Response(stream_with_context(generate()), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': 'attachment; filename="%s"' % filename,
+        'X-Accel-Buffering': 'no',
+    })
+
+
+@route('/stats/sql')
+@login_required
+@admin_required
+def view_sql_stats():
+    return jsonify(sql_statement_stats())
+
+
+@route('/metrics')
+def metrics():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        # fresh registry per scrape over every worker's sample files
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
     else:
-            print(department)  
-            try:
-            # Admin can see all data0
-                users = conn.execute('''
-                    SELECT id, username, department, full_name ,role
-                    FROM users 
-                    WHERE users.department = ? AND users.role = 'user' 
-                    ORDER BY users.id
-                ''', (department,)).fetchall()
-
-                conn.close()
-                
-                return render_template('view_all_users.html', users=users)
-            except:
-                return render_template('page-404.html', error_msg='لا يوجد هذا القسم ')
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
 
 
-@app.route('/view/users')
+@route('/view/users')
+@read_only
 @login_required
 @admin_required
+@conditional(lambda: [table_scope('users')])
 def view_users():
     conn = get_db_connection()
     # Admin can see all data0
     users = conn.execute('''
-        SELECT id, username, department, full_name ,role
+        SELECT users.id, username, departments.name AS department, full_name ,role
         FROM users 
-        WHERE users.department = ? AND users.role = 'user' 
+        JOIN departments ON users.department_id = departments.id
+        WHERE users.department_id = ? AND users.role = 'user' 
         ORDER BY users.id
         
-    ''', (session['department'],)).fetchall()
+    ''', (session_department_id(),)).fetchall()
 
     headusers = conn.execute('''
-        SELECT id, username, department, full_name ,role
+        SELECT users.id, username, departments.name AS department, full_name ,role
         FROM users 
+        JOIN departments ON users.department_id = departments.id
         WHERE users.role = 'head' 
         ORDER BY users.id
         
     ''').fetchall()
-    conn.close()
     print(users)
     return render_template('view_data/view_users.html', users=users,headusers=headusers)
 
-@app.route('/view/persons13w4z6e7e5a4r76n<int:id>w46das5s4a6', methods=['GET', 'POST'])
+# Profile fragments: every section of view_data/profile.html is its own
+# partial under view_data/profile/, rendered from the tables it lists in
+# PROFILE_SECTIONS. Rendered sections are kept per process, keyed by the
+# owner, the section, the data version of each of its tables and what the
+# viewer may do there; a hit skips both the queries and the render.
+FRAGMENT_CACHE_SIZE = int(os.getenv('FRAGMENT_CACHE_SIZE', '5000'))
+
+# profile table -> fetchone / fetchall
+PROFILE_TABLES = {
+    'university_evaluation': 'one',
+    'Scientific_production': 'one',
+    'Evaluation_aspects': 'one',
+    'ethics_responsibility': 'one',
+    'academic_data': 'all',
+    'activity_data': 'all',
+    'Scientific_research': 'all',
+    'participate_conference': 'all',
+}
+# section -> (template variable, table) pairs it is rendered from
+PROFILE_SECTIONS = {
+    'university': [('university_evaluation', 'university_evaluation')],
+    'production': [('Scientific_production', 'Scientific_production')],
+    'criteria': [('Evaluation_aspects', 'Evaluation_aspects')],
+    'ethics': [('ethics_responsibility', 'ethics_responsibility')],
+    'total': [('university_evaluation', 'university_evaluation'),
+              ('Scientific_production', 'Scientific_production'),
+              ('Evaluation_aspects', 'Evaluation_aspects')],
+    'semesters': [('semseters', 'academic_data')],
+    'activity': [('activity', 'activity_data')],
+    'research': [('Scientific_research', 'Scientific_research')],
+    'conference': [('participate_conference', 'participate_conference')],
+}
+
+
+def profile_scopes(id):
+    return [version_scope(id, table) for table in PROFILE_TABLES]
+
+
+def profile_rows(conn, table, user_id):
+    cursor = conn.execute('''
+        SELECT %s.*, users.username, users.full_name
+        FROM %s
+        JOIN users ON %s.user_id = users.id
+        WHERE %s.user_id = ?
+    ''' % (table, table, table, table), (user_id,))
+    return cursor.fetchone() if PROFILE_TABLES[table] == 'one' else cursor.fetchall()
+
+
+class FragmentCache:
+    # Per-process LRU of rendered Markup. Keys carry the data versions, so
+    # entries are never invalidated in place; superseded ones age out.
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+            return fragment
+
+    def put(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+
+def profile_sections(conn, user_id):
+    # versions are read before any data, so a write racing this render can
+    # only leave newer data under an older key, never the other way round
+    versions = data_versions(conn, profile_scopes(user_id))
+    owner = session.get('user_id') == user_id
+    reviewer = session.get('role') != 'user'
+    loaded = {}
+    sections = {}
+    for section, sources in PROFILE_SECTIONS.items():
+        key = (user_id, section, tuple(versions[version_scope(user_id, table)] for _, table in sources), owner, reviewer)
+        fragment = fragment_cache.get(key)
+        if fragment is None:
+            for _, table in sources:
+                if table not in loaded:
+                    loaded[table] = profile_rows(conn, table, user_id)
+            context = {name: loaded[table] for name, table in sources}
+            fragment = Markup(render_template('view_data/profile/%s.html' % section, id=user_id,
+                                              owner=owner, reviewer=reviewer, **context))
+            fragment_cache.put(key, fragment)
+        sections[section] = fragment
+    return sections
+
+
+@route('/view/persons13w4z6e7e5a4r76n<int:id>w46das5s4a6', methods=['GET', 'POST'])
+@read_only
 @login_required
 # @admin_required
+@conditional(profile_scopes)
 def view_person(id):
     conn = get_db_connection()
-    
-    # Admin can see all data0
 
     user = conn.execute('''
-        SELECT  department, full_name ,id
+        SELECT  departments.name AS department, full_name ,users.id
         FROM users 
+        JOIN departments ON users.department_id = departments.id
         WHERE users.id = ? 
         
     ''', (id,)).fetchone()
 
-    university_evaluation = conn.execute('''
-            SELECT university_evaluation.*, users.username, users.full_name 
-            FROM university_evaluation 
-            JOIN users ON university_evaluation.user_id = users.id
-            WHERE university_evaluation.user_id = ?
-            
-        ''',(id,)).fetchone()
-    
-    Evaluation_aspects = conn.execute('''
-            SELECT Evaluation_aspects.*, users.username, users.full_name 
-            FROM Evaluation_aspects 
-            JOIN users ON Evaluation_aspects.user_id = users.id
-            WHERE Evaluation_aspects.user_id = ?
-            
-        ''',(id,)).fetchone()
-    
-    Scientific_production = conn.execute('''
-            SELECT Scientific_production.*, users.username, users.full_name 
-            FROM Scientific_production 
-            JOIN users ON Scientific_production.user_id = users.id
-            WHERE Scientific_production.user_id = ?
-            
-        ''',(id,)).fetchone()
+    return render_template('view_data/profile.html', id=id, user=user, sections=profile_sections(conn, id))
 
-    ethics_responsibility = conn.execute('''
-            SELECT ethics_responsibility.*, users.username, users.full_name 
-            FROM ethics_responsibility 
-            JOIN users ON ethics_responsibility.user_id = users.id
-            WHERE ethics_responsibility.user_id = ?
-            
-        ''',(id,)).fetchone()
-    
-    semseters = conn.execute('''
-            SELECT academic_data.*, users.username, users.full_name 
-            FROM academic_data 
-            JOIN users ON academic_data.user_id = users.id
-            WHERE academic_data.user_id = ?
-        ''', (id,)).fetchall()
-
-    activity = conn.execute('''
-        SELECT activity_data.*, users.username, users.full_name 
-        FROM activity_data 
-        JOIN users ON activity_data.user_id = users.id
-        WHERE activity_data.user_id = ?
-    ''', (id,)).fetchall()
-
-    Scientific_research = conn.execute('''
-        SELECT Scientific_research.*, users.username, users.full_name 
-        FROM Scientific_research 
-        JOIN users ON Scientific_research.user_id = users.id
-        WHERE Scientific_research.user_id = ?
-    ''', (id,)).fetchall()
-
-   
-
-    participate_conference = conn.execute('''
-        SELECT participate_conference.*, users.username, users.full_name 
-        FROM participate_conference 
-        JOIN users ON participate_conference.user_id = users.id
-        WHERE participate_conference.user_id = ?
-    ''', (id,)).fetchall()
-   
-
-    conn.close()
-    return render_template('view_data/profile.html', id=id,user=user, university_evaluation=university_evaluation,Scientific_production=Scientific_production,Evaluation_aspects=Evaluation_aspects
-                          ,semseters=semseters, activity=activity,current_year=current_year,participate_conference=participate_conference,Scientific_research=Scientific_research, ethics_responsibility=ethics_responsibility)
-
-@app.route('/update/university/<int:id>', methods=['GET', 'POST'])
+@route('/update/university/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update_university(id):
     if session.get('role') == 'admin' or session.get('role') == 'head':
         if request.method == 'POST':
-            # Get form data 
-            department_load_Evaluation = request.form['department_load_Evaluation']
-            workshop_develop_Evaluation = request.form['workshop_develop_Evaluation']
-            medical_services_Evaluation = request.form['medical_services_Evaluation']
-            program_bank_Evaluation = request.form['program_bank_Evaluation']
-
-            evaluation_fields = [
-            'department_load_Evaluation',
-            'workshop_develop_Evaluation',
-            'medical_services_Evaluation',
-            'program_bank_Evaluation'
-             ]
-
-            # Calculate sum with error handling
-            try:
-                evaluation_sum = sum(int(request.form[field]) for field in evaluation_fields)
-            except ValueError as e:
-                # Handle case where a value can't be converted to int
-                evaluation_sum = 0  # or raise an exception
-                print(f"Error converting form values: {e}")
-
-            check_query = '''SELECT evaluation_sum FROM university_evaluation 
-             WHERE user_id == ? and evaluation_year == ? '''
-            # Insert into database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            check = cursor.execute(check_query, (id,current_year)).fetchone()[0]
-            if(check == None):
-                update_query = ''' UPDATE university_evaluation SET department_load_Evaluation == ?,
-                workshop_develop_Evaluation == ?, medical_services_Evaluation == ? ,
-                program_bank_Evaluation == ?, evaluation_sum == ?
-                WHERE university_evaluation.user_id == ? '''
-
-                cursor.execute(update_query, (department_load_Evaluation,workshop_develop_Evaluation,
-                medical_services_Evaluation,program_bank_Evaluation,evaluation_sum,id))
-                conn.commit()
-                conn.close()
-            else:
-                conn.close()
-                return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')
-            flash('Data added successfully!', 'success')
-            return redirect(url_for('view_person',id=id))
+            return submit_evaluation('university_evaluation', id)
 
         conn = get_db_connection()
 
@@ -955,7 +2269,6 @@ def update_university(id):
             WHERE university_evaluation.user_id = ?
             ORDER BY university_evaluation.created_at DESC
         ''',(id,)).fetchone()
-        conn.close()
 
         return render_template('admin/update_university.html',id=id, university_evaluation=university_evaluation)
     else:
@@ -964,261 +2277,234 @@ def update_university(id):
 
 
 
-@app.route('/kpis')
-@login_required
-def view_kpis():
+# KPI engine: the whole dashboard in one round trip. Each figure is its own
+# scalar subquery with the scope filter inside it, so every table is read
+# through its own index (idx_<table>_user for a department, the category
+# index for papers) instead of being copied into one derived table first.
+KPI_QUERY = '''
+    SELECT
+        (SELECT COUNT(*) FROM users WHERE role != 'admin'%(users)s) AS faculty_count,
+        (SELECT COUNT(*) FROM academic_data%(where)s) AS academic_count,
+        (SELECT COUNT(DISTINCT user_id) FROM activity_data%(where)s) AS activity_users,
+        (SELECT COUNT(*) FROM University_Service%(where)s) AS service_count,
+        (SELECT COUNT(*) FROM Scientific_research
+         WHERE research_category = %(paper)d AND publisher_category = %(conference)d%(also)s) AS conference_papers,
+        (SELECT COUNT(*) FROM Scientific_research
+         WHERE research_category = %(paper)d AND publisher_category = %(journal)d%(also)s) AS journal_papers,
+        (SELECT COUNT(DISTINCT user_id) FROM participate_conference%(where)s) AS conference_users,
+        (SELECT SUM(evaluation_sum) FROM Evaluation_aspects%(where)s) AS aspects_score,
+        (SELECT SUM(evaluation_sum) FROM university_evaluation%(where)s) AS university_score
+'''
+KPI_OWNERS = 'user_id IN (SELECT id FROM users WHERE department_id = ?)'
+KPI_CATEGORIES = {'paper': RESEARCH_PAPER, 'conference': PUBLISHER_CONFERENCE, 'journal': PUBLISHER_JOURNAL}
+KPI_FACULTY_QUERY = KPI_QUERY % dict(KPI_CATEGORIES, users='', where='', also='')
+KPI_DEPARTMENT_QUERY = KPI_QUERY % dict(KPI_CATEGORIES, users=' AND department_id = ?', where=' WHERE ' + KPI_OWNERS,
+                                        also=' AND ' + KPI_OWNERS)
+
+
+@dataclass(frozen=True)
+class KpiReport:
+    department: str
+    faculty_count: int
+    academic_count: int
+    activity_users: int
+    service_count: int
+    conference_papers: int
+    journal_papers: int
+    conference_users: int
+    aspects_score: int
+    university_score: int
+
+    def _percent(self, value):
+        return int(value * 100 / self.faculty_count) if self.faculty_count else 0
+
+    @property
+    def activity_percent(self):
+        return self._percent(self.activity_users)
+
+    @property
+    def conference_paper_percent(self):
+        return self._percent(self.conference_papers)
+
+    @property
+    def journal_paper_percent(self):
+        return self._percent(self.journal_papers)
+
+    @property
+    def conference_percent(self):
+        return self._percent(self.conference_users)
+
+    @property
+    def aspects_average(self):
+        return int(self.aspects_score / self.faculty_count) if self.faculty_count else 0
+
+    @property
+    def university_average(self):
+        return int(self.university_score / self.faculty_count) if self.faculty_count else 0
+
+
+def compute_kpis(conn, department=None):
+    # department=None means the whole faculty
+    if department is None:
+        row = conn.execute(KPI_FACULTY_QUERY).fetchone()
+    else:
+        row = conn.execute(KPI_DEPARTMENT_QUERY, (department_id(conn, department),) * KPI_DEPARTMENT_QUERY.count('?')).fetchone()
+    values = {name: int(row[name] or 0) for name in KpiReport.__dataclass_fields__ if name != 'department'}
+    return KpiReport(department=department or 'All', **values)
+
+
+KPI_CACHE_TTL = int(os.getenv('KPI_CACHE_TTL', '300'))
+
+
+class KpiCache:
+    # Per-process cache of KpiReport keyed by department (None = whole faculty).
+    # An entry only answers for the data versions it was computed at, so a
+    # write in any worker retires it; write routes also invalidate locally
+    # and the TTL bounds the age of anything else.
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, department, versions=None):
+        entry = self._entries.get(department)
+        if entry is None or entry[1] != versions or time.monotonic() - entry[0] > self.ttl:
+            return None
+        return entry[2]
+
+    def put(self, department, report, versions=None):
+        with self._lock:
+            self._entries[department] = (time.monotonic(), versions, report)
+
+    def invalidate(self, department):
+        # a write changes its own department and the faculty-wide totals
+        with self._lock:
+            self._entries.pop(department, None)
+            self._entries.pop(None, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+kpi_cache = KpiCache(KPI_CACHE_TTL)
+
+
+# every table KPI_QUERY reads
+KPI_TABLES = ['users', 'academic_data', 'activity_data', 'University_Service', 'Scientific_research',
+              'participate_conference', 'Evaluation_aspects', 'university_evaluation']
+
+
+def kpi_scopes(department):
+    if department is None:
+        return [table_scope(table) for table in KPI_TABLES]
+    dept_id = department_id(get_db_connection(), department) or 0
+    return [department_scope(dept_id, table) for table in KPI_TABLES]
+
+
+def cached_kpis(department):
     conn = get_db_connection()
+    versions = tuple(data_versions(conn, kpi_scopes(department)).values())
+    kpis = kpi_cache.get(department, versions)
+    if kpis is None:
+        kpis = compute_kpis(conn, department)
+        kpi_cache.put(department, kpis, versions)
+    return kpis
+
+
+def kpi_scope():
+    # all / one department for admins, the head's own department for heads
+    if session.get('role') == 'head':
+        return session['department']
     department = request.args.get('department', 'All')
-    try:
-        if session.get('role') == 'admin' and department=="All" :
-            # Admin can see all data
-            academic_kpi = conn.execute(''' 
-            SELECT COUNT(*)
-            FROM academic_data
-            ''').fetchone()
-            activity_kpi = conn.execute(''' 
-            SELECT COUNT(DISTINCT user_id)
-            FROM  activity_data
-            ''').fetchone()
-            users = conn.execute(''' 
-            SELECT COUNT(*)
-            FROM  users
-            WHERE role != 'admin'
-            ''').fetchone()
-            University_Service = conn.execute(''' 
-            SELECT COUNT(*)
-            FROM  University_Service
-            ''').fetchone()
-            # Admin can see all data
-
-           
-            Scientific_research1 = conn.execute('''
-            SELECT COUNT(*)
-            FROM  Scientific_research
-            WHERE research_type LIKE "%بحث%" AND Publisher LIKE "%مؤتمر%" ;
-            ''').fetchone()
-
-            Scientific_research2 = conn.execute('''
-            SELECT COUNT(*)
-            FROM  Scientific_research
-            WHERE research_type LIKE "%بحث%" AND Publisher LIKE "%مجلة%" ;
-            ''').fetchone()
-
-            part_in_conf = conn.execute(''' 
-            SELECT COUNT(DISTINCT user_id )
-            FROM  participate_conference
-            ''').fetchone()
-
-            Evaluation_aspects = conn.execute(''' 
-            SELECT SUM(evaluation_sum)
-            FROM Evaluation_aspects
-            ''').fetchone()
-
-            university_evaluation = conn.execute(''' 
-            SELECT SUM(evaluation_sum)
-            FROM university_evaluation
-            ''').fetchone()
-
-            activity_percent = (activity_kpi[0]/(users[0]))*100
-            research2_percent = (Scientific_research2[0]/(users[0]))*100
-            research1_percent = (Scientific_research1[0]/(users[0]))*100
-            conf_percent = (part_in_conf[0]/(users[0]))*100
-            
-            Evaluation_aspects_percent = (Evaluation_aspects[0]/(users[0]))
-            university_evaluation_percent = (university_evaluation[0]/(users[0]))
-
-            return render_template('view_kpis.html', academic_kpi=academic_kpi[0],activity_kpi=activity_kpi[0],
-            activity_percent=int(activity_percent), University_Service=University_Service[0],
-            Scientific_research1=Scientific_research1[0],Scientific_research2=Scientific_research2[0],
-            research1_percent=int(research1_percent),research2_percent=int(research2_percent), conf_percent=int(conf_percent),
-            Evaluation_aspects_percent=int(Evaluation_aspects_percent),university_evaluation_percent=int(university_evaluation_percent), department=department)
-    
-        elif session.get('role') == 'admin' and department != "All":
-                # Admin can see all data
-                academic_kpi = conn.execute(''' 
-                SELECT COUNT(*)
-                FROM academic_data
-                JOIN users ON academic_data.user_id = users.id
-                WHERE users.department = ?
-                ''', (department,)).fetchone()
-                activity_kpi = conn.execute(''' 
-                SELECT COUNT(DISTINCT user_id)
-                FROM  activity_data
-                JOIN users ON activity_data.user_id = users.id
-                WHERE users.department = ?                            
-                ''', (department,)).fetchone()
-                users = conn.execute(''' 
-                SELECT COUNT(*)
-                FROM  users
-                WHERE role != 'admin' AND users.department = ?                            
-                ''',(department,)).fetchone()
-                University_Service = conn.execute(''' 
-                SELECT COUNT(*)
-                FROM  University_Service
-                JOIN users ON University_Service.user_id = users.id
-                WHERE users.department = ?                            
-                ''', (department,)).fetchone()
-
-                Scientific_research1 = conn.execute('''
-                SELECT COUNT(*)
-                FROM  Scientific_research
-                JOIN users ON Scientific_research.user_id = users.id
-                WHERE users.department = ? AND research_type LIKE "%بحث%" AND Publisher LIKE "%مؤتمر%" ;
-                ''', (department,)).fetchone()
-
-                Scientific_research2 = conn.execute('''
-                SELECT COUNT(*)
-                FROM  Scientific_research
-                JOIN users ON Scientific_research.user_id = users.id
-                WHERE users.department = ? AND research_type LIKE "%بحث%" AND Publisher LIKE "%مجلة%" ;
-                ''', (department,)).fetchone()
-
-                part_in_conf = conn.execute(''' 
-                SELECT COUNT(DISTINCT user_id )
-                FROM  participate_conference
-                JOIN users ON participate_conference.user_id = users.id
-                WHERE users.department = ? 
-                ''', (department,)).fetchone()
-
-                Evaluation_aspects = conn.execute(''' 
-                SELECT SUM(evaluation_sum)
-                FROM Evaluation_aspects
-                JOIN users ON Evaluation_aspects.user_id = users.id
-                WHERE users.department = ? 
-                ''',(department,)).fetchone()
-
-                university_evaluation = conn.execute(''' 
-                SELECT SUM(evaluation_sum)
-                FROM university_evaluation
-                JOIN users ON university_evaluation.user_id = users.id
-                WHERE users.department = ? 
-                ''',(department,)).fetchone()
+    return None if department == 'All' else department
 
-                
 
-                activity_percent = (activity_kpi[0]/(users[0]))*100
-                research2_percent = (Scientific_research2[0]/(users[0]))*100
-                research1_percent = (Scientific_research1[0]/(users[0]))*100
-                conf_percent = (part_in_conf[0]/(users[0]))*100
-                Evaluation_aspects_percent = (Evaluation_aspects[0]/(users[0]))
-                university_evaluation_percent = (university_evaluation[0]/(users[0]))
+@route('/kpis')
+@read_only
+@login_required
+@reviewer_required
+@conditional(lambda: kpi_scopes(kpi_scope()))
+def view_kpis():
+    kpis = cached_kpis(kpi_scope())
+    return render_template('view_kpis.html', kpis=kpis if kpis.faculty_count else None, department=kpis.department)
+
+# Rankings page: top-N of a department's year and the scores at a few
+# percentiles, each answered from idx_evaluation_rankings_rank.
+RANKING_TOP = int(os.getenv('RANKING_TOP', '10'))
+RANKING_PERCENTILES = [50, 75, 90]
+
+
+def top_ranked(conn, dept_id, year, limit):
+    return conn.execute('''
+        SELECT evaluation_rankings.user_id, total, sections, users.username, users.full_name
+        FROM evaluation_rankings
+        JOIN users ON evaluation_rankings.user_id = users.id
+        WHERE evaluation_rankings.department_id = ? AND evaluation_rankings.evaluation_year = ?
+        ORDER BY evaluation_rankings.total DESC, evaluation_rankings.user_id DESC
+        LIMIT ?
+    ''', (dept_id, year, limit)).fetchall()
+
+
+def ranking_percentiles(conn, dept_id, year, percentiles):
+    # nearest rank: the p-th percentile is the ceil(p% * count)-th lowest total
+    count = conn.execute('''
+        SELECT COUNT(*) AS count FROM evaluation_rankings WHERE department_id = ? AND evaluation_year = ?
+    ''', (dept_id, year)).fetchone()['count']
+    cutoffs = []
+    for percentile in percentiles if count else []:
+        row = conn.execute('''
+            SELECT total FROM evaluation_rankings
+            WHERE department_id = ? AND evaluation_year = ?
+            ORDER BY total
+            LIMIT 1 OFFSET ?
+        ''', (dept_id, year, max(0, -(-percentile * count // 100) - 1))).fetchone()
+        cutoffs.append((percentile, row['total']))
+    return count, cutoffs
+
+
+def ranking_department():
+    # heads see their own department, admins pick one (default: their own)
+    if session.get('role') == 'head':
+        return session['department']
+    return request.args.get('department') or session['department']
 
-                return render_template('view_kpis.html', academic_kpi=academic_kpi[0],activity_kpi=activity_kpi[0],
-                activity_percent=int(activity_percent), University_Service=University_Service[0],
-                Scientific_research1=Scientific_research1[0],Scientific_research2=Scientific_research2[0],
-                research1_percent=int(research1_percent),research2_percent=int(research2_percent), conf_percent=int(conf_percent),
-                Evaluation_aspects_percent=int(Evaluation_aspects_percent),university_evaluation_percent=int(university_evaluation_percent),department=department)
 
-        
-        elif session.get('role') == 'head'  :
-                # Admin can see all data
-                academic_kpi = conn.execute(''' 
-                SELECT COUNT(*)
-                FROM academic_data
-                JOIN users ON academic_data.user_id = users.id
-                WHERE users.department = ?
-                ''', (session['department'],)).fetchone()
-                activity_kpi = conn.execute(''' 
-                SELECT COUNT(DISTINCT user_id)
-                FROM  activity_data
-                JOIN users ON activity_data.user_id = users.id
-                WHERE users.department = ?                            
-                ''', (session['department'],)).fetchone()
-                users = conn.execute(''' 
-                SELECT COUNT(*)
-                FROM  users
-                WHERE role != 'admin' AND users.department = ?                            
-                ''', (session['department'],)).fetchone()
-                University_Service = conn.execute(''' 
-                SELECT COUNT(*)
-                FROM  University_Service
-                JOIN users ON University_Service.user_id = users.id
-                WHERE users.department = ?                            
-                ''', (session['department'],)).fetchone()
-                # Admin can see all data
-
-               
-                Scientific_research1 = conn.execute('''
-                SELECT COUNT(*)
-                FROM  Scientific_research
-                JOIN users ON Scientific_research.user_id = users.id
-                WHERE users.department = ? AND research_type LIKE "%بحث%" AND Publisher LIKE "%مؤتمر%" ;
-                ''', (session['department'],)).fetchone()
-
-                Scientific_research2 = conn.execute('''
-                SELECT COUNT(*)
-                FROM  Scientific_research
-                JOIN users ON Scientific_research.user_id = users.id
-                WHERE users.department = ? AND research_type LIKE "%بحث%" AND Publisher LIKE "%مجلة%" ;
-                ''', (session['department'],)).fetchone()
-
-                part_in_conf = conn.execute(''' 
-                SELECT COUNT(DISTINCT user_id )
-                FROM  participate_conference
-                JOIN users ON participate_conference.user_id = users.id
-                WHERE users.department = ? 
-                ''', (session['department'],)).fetchone()
-
-                Evaluation_aspects = conn.execute(''' 
-                SELECT SUM(evaluation_sum)
-                FROM Evaluation_aspects
-                JOIN users ON Evaluation_aspects.user_id = users.id
-                WHERE users.department = ? 
-                ''', (session['department'],)).fetchone()
-
-                university_evaluation = conn.execute(''' 
-                SELECT SUM(evaluation_sum)
-                FROM university_evaluation
-                JOIN users ON university_evaluation.user_id = users.id
-                WHERE users.department = ? 
-                ''', (session['department'],)).fetchone()
-
-                activity_percent = (activity_kpi[0]/(users[0]))*100
-                research2_percent = (Scientific_research2[0]/(users[0]))*100
-                research1_percent = (Scientific_research1[0]/(users[0]))*100
-                conf_percent = (part_in_conf[0]/(users[0]))*100
-                
-                Evaluation_aspects_percent = (Evaluation_aspects[0]/(users[0])) if users[0] > 0 else 0
-                university_evaluation_percent = (university_evaluation[0]/(users[0])) if users[0] > 0 else 0
-
-                return render_template('view_kpis.html', academic_kpi=academic_kpi[0],activity_kpi=activity_kpi[0],
-                activity_percent=int(activity_percent), University_Service=University_Service[0],
-                Scientific_research1=Scientific_research1[0],Scientific_research2=Scientific_research2[0],
-                research1_percent=int(research1_percent),research2_percent=int(research2_percent), conf_percent=int(conf_percent),
-                Evaluation_aspects_percent=int(Evaluation_aspects_percent),university_evaluation_percent=int(university_evaluation_percent),department=session.get("department"))
-    except:
-        return render_template('view_kpis.html', activity=0)
-    finally:
-        conn.close()
+def ranking_scopes():
+    dept_id = department_id(get_db_connection(), ranking_department()) or 0
+    return [department_scope(dept_id, table) for table in RANKED_TABLES + ['users']]
+
 
-@app.route('/update/<int:id>', methods=['GET', 'POST'])
+@route('/rankings')
+@read_only
+@login_required
+@admin_required
+@conditional(ranking_scopes)
+def view_rankings():
+    conn = get_db_connection()
+    department = ranking_department()
+    dept_id = department_id(conn, department)
+    if dept_id is None:
+        return render_template('page-404.html', error_msg='Page Not Found')
+    year = request.args.get('year', current_year(), type=int)
+    limit = max(1, min(request.args.get('top', RANKING_TOP, type=int), MAX_PAGE_SIZE))
+    years = [row['evaluation_year'] for row in conn.execute('''
+        SELECT DISTINCT evaluation_year FROM evaluation_rankings WHERE department_id = ? ORDER BY evaluation_year DESC
+    ''', (dept_id,)).fetchall()]
+    departments = []
+    if session.get('role') == 'admin':
+        departments = [row['name'] for row in conn.execute('SELECT name FROM departments ORDER BY name').fetchall()]
+    count, percentiles = ranking_percentiles(conn, dept_id, year, RANKING_PERCENTILES)
+    return render_template('view_rankings.html', department=department, departments=departments, year=year,
+                           years=years, top=top_ranked(conn, dept_id, year, limit), count=count,
+                           percentiles=percentiles, sections=len(RANKED_TABLES))
+
+@route('/update/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update(id):
     if session.get('role') == 'admin' or session.get('role') == 'head':
         if request.method == 'POST':
-            # Get form data
-            Scientific_research_Evaluation = request.form['Scientific_research_Evaluation']
-            supervision_Graduation_Evaluation = request.form['supervision_Graduation_Evaluation']
-            data = {
-                'supervision_Graduation_Evaluation' : request.form['supervision_Graduation_Evaluation'],
-                'user_id' : id
-            }
-            check_query = '''SELECT supervision_Graduation_Evaluation FROM Scientific_production 
-             WHERE user_id == ? and evaluation_year == ? '''
-            # Insert into database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            check = cursor.execute(check_query, (id,current_year)).fetchone()[0]
-            print(check)
-            if (check == None):
-                update_query = " UPDATE Scientific_production SET Scientific_research_Evaluation == ?, supervision_Graduation_Evaluation == ? WHERE Scientific_production.user_id == ? "
-                cursor.execute(update_query, (Scientific_research_Evaluation,supervision_Graduation_Evaluation,id))
-                conn.commit()
-                conn.close()
-            else:
-                conn.close()
-                return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')
-            return redirect(url_for('view_person',id=id))
+            return submit_evaluation('Scientific_production', id)
 
         conn = get_db_connection()
 
@@ -1230,75 +2516,18 @@ def update(id):
             WHERE Scientific_production.user_id = ?
             ORDER BY Scientific_production.created_at DESC
         ''',(id,)).fetchone()
-        conn.close()
 
         return render_template('admin/update.html',id=id, Scientific_production=Scientific_production)
     else:
          return render_template('page-404.html', error_msg='Page Not Found')
 
 
-@app.route('/update/criteria/<int:id>', methods=['GET', 'POST'])
+@route('/update/criteria/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update_criteria(id):
     if session.get('role') == 'head':
         if request.method == 'POST':
-            # Get form data 
-            Develop_courses_Evaluation = request.form['Develop_courses_Evaluation']
-            Prepare_file_Evaluation = request.form['Prepare_file_Evaluation']
-            Electronic_tests_Evaluation = request.form['Electronic_tests_Evaluation']
-            Prepare_material_Evaluation = request.form['Prepare_material_Evaluation']
-            Use_learning_Evaluation = request.form['Use_learning_Evaluation']
-            teaching_methods_Evaluation = request.form['teaching_methods_Evaluation']
-            Methods_student_Evaluation = request.form['Methods_student_Evaluation']
-            preparing_test_Evaluation = request.form['preparing_test_Evaluation']
-            Provide_academic_Evaluation = request.form['Provide_academic_Evaluation']
-
-            evaluation_fields = [
-            'Develop_courses_Evaluation',
-            'Prepare_file_Evaluation',
-            'Electronic_tests_Evaluation',
-            'Prepare_material_Evaluation',
-            'Use_learning_Evaluation',
-            'teaching_methods_Evaluation',
-            'Methods_student_Evaluation',
-            'preparing_test_Evaluation',
-            'Provide_academic_Evaluation'
-             ]
-
-            # Calculate sum with error handling
-            try:
-                evaluation_sum = sum(int(request.form[field]) for field in evaluation_fields)
-            except ValueError as e:
-                # Handle case where a value can't be converted to int
-                evaluation_sum = 0  # or raise an exception
-                print(f"Error converting form values: {e}")
-
-            check_query = '''SELECT evaluation_sum FROM Evaluation_aspects 
-             WHERE user_id == ? and evaluation_year == ? '''
-            # Insert into database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            check = cursor.execute(check_query, (id,current_year)).fetchone()[0]
-
-            if(check == None):
-
-                update_query = ''' UPDATE Evaluation_aspects SET Develop_courses_Evaluation == ?,
-                Prepare_file_Evaluation == ?, Electronic_tests_Evaluation == ? ,
-                Prepare_material_Evaluation == ?, Use_learning_Evaluation == ?,
-                teaching_methods_Evaluation == ?, Methods_student_Evaluation == ?,
-                preparing_test_Evaluation == ?, Provide_academic_Evaluation == ? , evaluation_sum == ?
-                WHERE Evaluation_aspects.user_id == ? '''
-
-                cursor.execute(update_query, (Develop_courses_Evaluation,Prepare_file_Evaluation,
-                Electronic_tests_Evaluation,Prepare_material_Evaluation,
-                Use_learning_Evaluation,teaching_methods_Evaluation,
-                Methods_student_Evaluation,preparing_test_Evaluation,Provide_academic_Evaluation,evaluation_sum,id))
-                conn.commit()
-                conn.close()
-            else:
-                conn.close()
-                return render_template('page-404.html', error_msg=' لقد قمت بالتقييم بالفعل هذا العام ❌')
-            return redirect(url_for('view_person',id=id))
+            return submit_evaluation('Evaluation_aspects', id)
 
         conn = get_db_connection()
 
@@ -1310,12 +2539,191 @@ def update_criteria(id):
             WHERE Evaluation_aspects.user_id = ?
             ORDER BY Evaluation_aspects.created_at DESC
         ''',(id,)).fetchone()
-        conn.close()
 
         return render_template('admin/criteria_of_evaluation.html',id=id, Evaluation_aspects=Evaluation_aspects)
     else:
          return render_template('page-404.html', error_msg='Page Not Found')
 
+# Fingerprinted static files (see assets.py) are served from /assets/ with a
+# year-long immutable Cache-Control, as the brotli or gzip copy when the
+# client accepts one. Templates link them through asset_url(), which falls
+# back to the plain static URL for files missing from the manifest, e.g.
+# when `flask build-assets` has not been run.
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+
+def asset_url(filename):
+    built = current_app.extensions['assets'].path(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=built)
+
+
+@route('/assets/<path:filename>')
+def asset(filename):
+    encodings = current_app.extensions['assets'].encodings.get(filename)
+    if encodings is None:
+        abort(404)
+    encoding = next((e for e in encodings if request.accept_encodings[e]), None)
+    response = send_from_directory(
+        current_app.config['ASSETS_DIR'], filename + assets.ENCODINGS[encoding] if encoding else filename,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream', max_age=ASSET_MAX_AGE,
+        download_name=filename)
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.content_encoding = encoding
+    return response
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Fingerprint and precompress the files in static/."""
+    manifest = assets.build(current_app.static_folder, current_app.config['ASSETS_DIR'])
+    current_app.extensions['assets'] = manifest
+    for name, entry in sorted(manifest.entries.items()):
+        click.echo('%-24s %-32s %s' % (name, entry['path'], ' '.join(entry['encodings'])))
+
+
+# `flask seed`: deterministic synthetic data at load-test volumes (see
+# seed.py), written with batched executemany, one transaction per table.
+def insert_rows(conn, table, columns, rows, batch_size):
+    query = 'INSERT INTO %s (%s) VALUES (%s)' % (table, ', '.join(columns), ', '.join(['?'] * len(columns)))
+    count = 0
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        conn.executemany(query, batch)
+        count += len(batch)
+    conn.commit()
+    return count
+
+
+@click.command('seed')
+@click.option('--faculty', default=200, show_default=True, help='Faculty accounts to create.')
+@click.option('--departments', default=10, show_default=True, help='Departments to spread them over.')
+@click.option('--years', default=10, show_default=True, help='Years of history per account.')
+@click.option('--seed', 'seed_value', default=1, show_default=True, help='Random seed; same seed, same data.')
+@click.option('--prefix', default='seed', show_default=True, help='Username prefix of the generated accounts.')
+@click.option('--password', default='seed1234', show_default=True, help='Password of every generated account.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows per executemany.')
+@with_appcontext
+def seed_command(faculty, departments, years, seed_value, prefix, password, batch_size):
+    """Fill the database with synthetic faculty and their history."""
+    conn = get_db_connection()
+    if conn.execute('SELECT 1 FROM users WHERE username = ?', (prefix + '_admin',)).fetchone():
+        raise click.ClickException('already seeded with prefix %r, pick another --prefix' % prefix)
+    started = time.perf_counter()
+    department_ids = [ensure_department(conn, name) for name in seed.department_names(departments)]
+    # one hash for every account: hashing thousands of them would dominate the run
+    users = seed.users(seed_value, prefix, department_ids, faculty, hash_password(password))
+    count = insert_rows(conn, 'users', ['username', 'password', 'department_id', 'role', 'full_name'],
+                        users, batch_size)
+    bump_department_versions(conn, 'users', department_ids)
+    conn.commit()
+    click.echo('%-24s %9d rows' % ('users', count))
+    # exactly the accounts just inserted: a LIKE on the prefix would also
+    # take in those of a longer one (seed_2_00001 under seed)
+    usernames = [seed.username(prefix, i) for i in range(faculty)]
+    user_ids = []
+    for start in range(0, len(usernames), batch_size):
+        chunk = usernames[start:start + batch_size]
+        user_ids += [row['id'] for row in conn.execute(
+            'SELECT id FROM users WHERE username IN (%s)' % ', '.join(['?'] * len(chunk)), tuple(chunk)).fetchall()]
+    user_ids.sort()
+    maxima = {field: maximum for fields, _, _ in EVALUATIONS.values() for field, maximum in fields}
+
+    for table, (columns, _, _) in seed.TABLES.items():
+        rows = seed.table_rows(seed_value, table, user_ids, years, maxima)
+        derived_columns, derive = IMPORT_TARGETS.get(table, {}).get('derived', ([], None))
+        if derive:
+            rows = (row + tuple(derive(dict(zip(columns, row[1:])))) for row in rows)
+        count = insert_rows(conn, table, ['user_id'] + columns + derived_columns, rows, batch_size)
+        bump_department_versions(conn, table, department_ids)
+        conn.commit()
+        click.echo('%-24s %9d rows' % (table, count))
+    count = rebuild_rankings(conn)
+    conn.commit()
+    click.echo('%-24s %9d rows' % ('evaluation_rankings', count))
+    click.echo('seeded in %.1fs; log in as %s_admin, %s_00001 (head) or %s_%05d (user) with password %r'
+               % (time.perf_counter() - started, prefix, prefix, prefix, min(faculty, departments + 1), password))
+
+
+@click.command('rebuild-rankings')
+@with_appcontext
+def rebuild_rankings_command():
+    """Recompute evaluation_rankings from the evaluation tables."""
+    conn = get_db_connection()
+    count = rebuild_rankings(conn)
+    # cached ranking pages are keyed on the department versions
+    department_ids = [row['id'] for row in conn.execute('SELECT id FROM departments').fetchall()]
+    for table in RANKED_TABLES:
+        bump_department_versions(conn, table, department_ids)
+    conn.commit()
+    click.echo('%-24s %9d rows' % ('evaluation_rankings', count))
+
+
+def enable_bytecode_cache(app, directory):
+    # compiled templates are written to disk and reused by every later boot;
+    # entries are checked against the template source, so an edited
+    # template just misses and is compiled again
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        pass
+    if not os.access(directory, os.W_OK):
+        app.logger.warning('template bytecode cache disabled: %s is not writable', directory)
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+
+def precompile_templates(app):
+    # compile every template once up front; under --preload this happens in
+    # the gunicorn master and the compiled code is shared by the workers
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_mapping(
+        SECRET_KEY=os.getenv('SECRET_KEY', 'your_secret_key_here'),  # Change this in production!
+        WARM_UP=os.getenv('WARM_UP', 'true').lower() in ('1', 'true', 'yes', 'on'),
+        ASSETS_DIR=os.path.join(app.static_folder, 'dist'),
+        # off when a proxy in front already compresses responses
+        COMPRESS_RESPONSES=os.getenv('COMPRESS_RESPONSES', 'true').lower() in ('1', 'true', 'yes', 'on'),
+        COMPRESS_MIN_SIZE=int(os.getenv('COMPRESS_MIN_SIZE', '500')),
+        # empty disables the on-disk template bytecode cache
+        JINJA_CACHE_DIR=os.getenv('JINJA_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.jinja-cache')),
+    )
+    if config:
+        app.config.update(config)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.wsgi_app = RequestMetrics(app.wsgi_app)
+    if app.config['COMPRESS_RESPONSES']:
+        # outermost, so the request timings include the compression
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=app.config['COMPRESS_MIN_SIZE'])
+    app.before_request(label_request_metrics)
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(stop_template_timer, app)
+    app.teardown_appcontext(close_db_connection)
+    app.extensions['assets'] = assets.Manifest.load(app.config['ASSETS_DIR'])
+    app.add_template_global(asset_url)
+    app.extensions['release'] = release_id(app)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(rebuild_rankings_command)
+    if app.config['JINJA_CACHE_DIR']:
+        enable_bytecode_cache(app, app.config['JINJA_CACHE_DIR'])
+    if app.config['WARM_UP']:
+        precompile_templates(app)
+    return app
+
+
+app = create_app()
 
 
 if __name__ == '__main__':
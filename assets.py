@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Fingerprinted static assets. `flask build-assets` copies every file under
+# static/ into static/dist/ with a hash of its content in the name, next to
+# .br / .gz copies of the compressible ones, and records logical name ->
+# built name in static/dist/manifest.json. A changed file gets a new URL,
+# so a built file can be cached by browsers for good.
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.json', '.html')
+# preferred first
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def fingerprint(name, data):
+    root, ext = os.path.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def available_encodings():
+    return [encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None]
+
+
+def compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the .gz bytes identical between builds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(source, target):
+    # target is rebuilt from scratch so files of old builds do not pile up
+    source = os.path.abspath(source)
+    target = os.path.abspath(target)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(source):
+        dirnames[:] = sorted(d for d in dirnames if os.path.join(dirpath, d) != target)
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            name = os.path.relpath(path, source).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            built = fingerprint(name, data)
+            _write(os.path.join(target, built), data)
+            encodings = []
+            if name.lower().endswith(COMPRESSIBLE):
+                for encoding in available_encodings():
+                    packed = compress(encoding, data)
+                    if len(packed) < len(data):
+                        _write(os.path.join(target, built + ENCODINGS[encoding]), packed)
+                        encodings.append(encoding)
+            entries[name] = {'path': built, 'encodings': encodings}
+    _write(os.path.join(target, MANIFEST), json.dumps(entries, indent=2, sort_keys=True).encode('utf-8'))
+    return Manifest(entries)
+
+
+class Manifest:
+    # logical name -> built name, and built name -> encodings on disk
+    def __init__(self, entries):
+        self.entries = entries
+        self.encodings = {entry['path']: entry['encodings'] for entry in entries.values()}
+
+    @classmethod
+    def load(cls, directory):
+        try:
+            with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls({})
+
+    def path(self, name):
+        entry = self.entries.get(name)
+        return entry['path'] if entry else None
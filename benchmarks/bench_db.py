@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+# Micro-benchmarks for the per-request DB wrapper hot path: SQL dialect
+# translation, Row access, MySQLCursor.fetch* over a stub cursor and the
+# auth decorators. Timings are compared with baseline.json as multiples of
+# a fixed pure-Python calibration loop timed alongside each of them, so a
+# slower or busier machine does not read as a regression. A benchmark
+# slower than baseline * (1 + threshold) is re-measured and fails the run
+# only if it is still over on every retry.
+#
+#   python benchmarks/bench_db.py              # compare with the baseline
+#   python benchmarks/bench_db.py --save       # record a new baseline
+#
+# Baselines are machine-specific: record them on the machine that runs
+# the comparison.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+sys.path.insert(0, ROOT)
+os.environ.setdefault('WARM_UP', 'false')
+os.environ.setdefault('QUERY_GUARD', 'off')
+
+import app  # noqa: E402
+
+PROFILE_QUERY = '''
+    SELECT academic_data.*, users.username, users.full_name
+    FROM academic_data
+    JOIN users ON academic_data.user_id = users.id
+    WHERE academic_data.user_id = ?
+'''
+CHECK_QUERY = '''SELECT evaluation_sum FROM university_evaluation
+             WHERE user_id == ? and evaluation_year == ? '''
+
+COLUMNS = ['id', 'user_id', 'semester', 'course_code', 'num_students', 'teaching_load', 'course_name',
+           'semester_type', 'credit_hours', 'd2l', 'QuestionMark', 'created_at', 'username', 'full_name']
+
+
+def result_set(size):
+    description = tuple((name, 253, None, None, None, None, True) for name in COLUMNS)
+    rows = tuple((i, 7, 'Fall 2024', 'ANA%d' % i, 120, '4', 'Anatomy', 'Fall', 3, 'yes', 'yes',
+                  '2024-10-01 10:00:00', 'seed_00007', 'ahmed mohamed') for i in range(size))
+    return description, rows
+
+
+class StubCursor:
+    # stands in for pymysql's buffered cursor: no network, fixed result set
+    connection = None
+
+    def __init__(self, description, rows):
+        self.description = description
+        self._rows = rows
+        self._position = 0
+
+    def execute(self, query, params):
+        self._position = 0
+
+    def executemany(self, query, params):
+        pass
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        self._position += 1
+        return self._rows[self._position - 1]
+
+    def fetchall(self):
+        return self._rows
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+@benchmark('adapt_sql_query (cached)')
+def bench_adapt_cached():
+    app.adapt_sql_query(PROFILE_QUERY)
+    return lambda: app.adapt_sql_query(PROFILE_QUERY)
+
+
+@benchmark('adapt_sql_query (uncached, KPI query)')
+def bench_adapt_uncached():
+    translate = app.adapt_sql_query.__wrapped__
+    return lambda: translate(app.KPI_DEPARTMENT_QUERY)
+
+
+@benchmark('row_index (14 columns)')
+def bench_row_index():
+    description, _ = result_set(1)
+    return lambda: app.row_index(description)
+
+
+@benchmark('Row[name]')
+def bench_row_by_name():
+    description, rows = result_set(1)
+    row = app.Row(rows[0], app.row_index(description))
+    return lambda: row['course_code']
+
+
+@benchmark('Row[index]')
+def bench_row_by_index():
+    description, rows = result_set(1)
+    row = app.Row(rows[0], app.row_index(description))
+    return lambda: row[3]
+
+
+@benchmark('execute + fetchone')
+def bench_fetchone():
+    cursor = app.MySQLCursor(StubCursor(*result_set(1)))
+    return lambda: cursor.execute(CHECK_QUERY, (7, 2024)).fetchone()
+
+
+@benchmark('execute + fetchall (50 rows)')
+def bench_fetchall_page():
+    cursor = app.MySQLCursor(StubCursor(*result_set(50)))
+    return lambda: cursor.execute(PROFILE_QUERY, (7,)).fetchall()
+
+
+@benchmark('execute + fetchall (1000 rows)')
+def bench_fetchall_large():
+    cursor = app.MySQLCursor(StubCursor(*result_set(1000)))
+    return lambda: cursor.execute(PROFILE_QUERY, (7,)).fetchall()
+
+
+def in_session(role):
+    context = app.app.test_request_context('/view')
+    context.push()
+    app.session.update({'user_id': 7, 'username': 'seed_00007', 'role': role})
+    return context
+
+
+@benchmark('login_required')
+def bench_login_required():
+    in_session('user')
+    view = app.login_required(lambda: None)
+    return view
+
+
+@benchmark('login_required + admin_required')
+def bench_admin_required():
+    in_session('head')
+    view = app.login_required(app.admin_required(lambda: None))
+    return view
+
+
+def calibration():
+    # fixed interpreter workload: tuple/dict building and attribute lookups
+    return lambda: [dict(zip(COLUMNS, (i,) * len(COLUMNS))) for i in range(20)]
+
+
+def measure(fn, calibrate, repeat):
+    # `repeat` rounds, each timing the calibration loop and then the
+    # benchmark (~50ms apiece). A round's benchmark/calibration ratio is
+    # immune to the machine speeding up or slowing down between rounds;
+    # the median ratio is what gets compared.
+    bench, calib = timeit.Timer(fn), timeit.Timer(calibrate)
+    number = max(1, bench.autorange()[0] // 4)
+    calib_number = max(1, calib.autorange()[0] // 4)
+    ratios, calibrations = [], []
+    for _ in range(repeat):
+        calibrations.append(calib.timeit(calib_number) / calib_number)
+        ratios.append(bench.timeit(number) / number / calibrations[-1])
+    return statistics.median(ratios), calibrations
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DB wrapper micro-benchmarks')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown over the baseline (default 0.25 = 25%%)')
+    parser.add_argument('--fast-threshold', type=float, default=0.5,
+                        help='allowed slowdown for benchmarks under 1us, where a few stray '
+                             'instructions are a large share (default 0.5 = 50%%)')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='re-measure a regressed benchmark this often before failing on it')
+    parser.add_argument('--repeat', type=int, default=9)
+    parser.add_argument('-k', dest='match', default='', help='only run benchmarks whose name contains this')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    ratios, calibrations = {}, []
+    regressions = []
+    print('%-40s %12s %12s %8s' % ('benchmark', 'time', 'baseline', 'change'))
+    for name, setup in BENCHMARKS.items():
+        if args.match not in name:
+            continue
+        fn = setup()
+        # baseline timings are stored in seconds next to the calibration
+        # time of the run that recorded them
+        reference = baseline[name] / baseline['calibration'] if name in baseline and 'calibration' in baseline else None
+        threshold = args.threshold
+        if name in baseline and baseline[name] < 1e-6:
+            threshold = max(threshold, args.fast_threshold)
+        for attempt in range(1 + (args.retries if reference is not None else 0)):
+            ratio, samples = measure(fn, calibration(), args.repeat)
+            if reference is None or ratio <= reference * (1 + threshold):
+                break
+        ratios[name] = ratio
+        calibrations += samples
+        seconds = ratio * statistics.median(samples)
+        change = '' if reference is None else '%+.0f%%' % ((ratio / reference - 1) * 100)
+        print('%-40s %10.3fus %10sus %8s' % (
+            name, seconds * 1e6, '-' if reference is None else '%.3f' % (reference * statistics.median(samples) * 1e6),
+            change))
+        if reference is not None and ratio > reference * (1 + threshold):
+            regressions.append(name)
+    calibration_time = statistics.median(calibrations) if calibrations else 0
+    print('calibration %.3fus (x%.2f of baseline machine)' % (
+        calibration_time * 1e6, calibration_time / baseline['calibration'] if 'calibration' in baseline else 1.0))
+
+    if args.save:
+        if not (args.match and 'calibration' in baseline):
+            # a subset is saved on the stored scale, a full run sets a new one
+            baseline['calibration'] = calibration_time
+        baseline.update({name: ratio * baseline['calibration'] for name, ratio in ratios.items()})
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('baseline written to %s' % os.path.relpath(BASELINE, ROOT))
+    elif regressions:
+        print('regressed beyond the threshold after %d retries: %s' % (args.retries, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import zlib
+
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Response compression as WSGI middleware. Responses whose type is in the
+# allowlist and that are at least min_size bytes (or of unknown length, i.e.
+# streamed) are sent brotli- or gzip-encoded, whichever the client prefers.
+# Streamed bodies are compressed chunk by chunk with a sync flush after
+# each one, so the client still receives every chunk as it is produced.
+
+COMPRESSIBLE_TYPES = frozenset([
+    'text/html', 'text/plain', 'text/css', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+])
+
+
+class _Gzip:
+    def __init__(self, level):
+        self._stream = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._stream.compress(data)
+
+    def flush(self):
+        return self._stream.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._stream.flush(zlib.Z_FINISH)
+
+
+class _Brotli:
+    def __init__(self, quality):
+        self._stream = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._stream.process(data)
+
+    def flush(self):
+        return self._stream.flush()
+
+    def finish(self):
+        return self._stream.finish()
+
+
+def accepted_encoding(header, offered):
+    # the first of `offered` with the highest q-value in Accept-Encoding
+    qualities = {}
+    for part in header.split(','):
+        token, _, params = part.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[token.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in offered:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(self, wsgi_app, min_size=500, gzip_level=6, brotli_quality=4, types=COMPRESSIBLE_TYPES):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.types = types
+        # brotli's low qualities beat gzip -6 on size at a similar cost; the
+        # slow top qualities are for build-time assets only
+        self.encoders = {'gzip': lambda: _Gzip(gzip_level)}
+        if brotli is not None:
+            self.encoders = {'br': lambda: _Brotli(brotli_quality), **self.encoders}
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get('REQUEST_METHOD') != 'HEAD':
+            encoding = accepted_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''), list(self.encoders))
+        state = {}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            state['encoder'] = None
+            if self.compressible(headers):
+                headers = vary_on_encoding(headers)
+                if encoding and self.worth_compressing(status, headers):
+                    headers = encoded_headers(headers, encoding)
+                    state['encoder'] = self.encoders[encoding]()
+            return start_response(status, headers, exc_info)
+
+        body = self.wsgi_app(environ, compressing_start_response)
+        encoder = state.get('encoder')
+        if encoder is None:
+            return body
+        return ClosingIterator(compressed(body, encoder), getattr(body, 'close', None))
+
+    def compressible(self, headers):
+        content_type = header_value(headers, 'Content-Type') or ''
+        return content_type.split(';')[0].strip().lower() in self.types
+
+    def worth_compressing(self, status, headers):
+        if not status.startswith('2') or status.startswith(('204', '206')):
+            return False
+        # a byte range of the identity body stays identity-encoded
+        if header_value(headers, 'Content-Range'):
+            return False
+        if header_value(headers, 'Content-Encoding') or 'no-transform' in (header_value(headers, 'Cache-Control') or ''):
+            return False
+        length = header_value(headers, 'Content-Length')
+        return length is None or int(length) >= self.min_size
+
+
+def header_value(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def vary_on_encoding(headers):
+    vary = header_value(headers, 'Vary')
+    if vary is None:
+        return headers + [('Vary', 'Accept-Encoding')]
+    if 'accept-encoding' in vary.lower() or vary.strip() == '*':
+        return headers
+    return [(key, value + ', Accept-Encoding' if key.lower() == 'vary' else value) for key, value in headers]
+
+
+def encoded_headers(headers, encoding):
+    # the encoded body is a different byte sequence, so a strong ETag of
+    # the identity body only holds weakly (If-None-Match compares weakly)
+    result = []
+    for key, value in headers:
+        name = key.lower()
+        if name == 'content-length':
+            continue
+        if name == 'etag' and not value.startswith('W/'):
+            value = 'W/' + value
+        result.append((key, value))
+    result.append(('Content-Encoding', encoding))
+    return result
+
+
+def compressed(body, encoder):
+    for chunk in body:
+        if chunk:
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+    yield encoder.finish()
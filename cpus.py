@@ -0,0 +1,30 @@
+import os
+
+
+# CPU budget of the container, shared by gunicorn.conf.py (worker count)
+# and app.py (password hashing processes per worker).
+
+def cpu_quota():
+    # CPUs granted to the container (cgroup v2, then v1), else the ones
+    # this process may run on
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, int(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, quota // period)
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+def gunicorn_workers():
+    return int(os.getenv('GUNICORN_WORKERS') or cpu_quota() * 2 + 1)
@@ -0,0 +1,69 @@
+import os
+import shutil
+
+from cpus import gunicorn_workers
+
+
+# Gunicorn settings for the Flask app. Everything can be overridden with
+# GUNICORN_* environment variables so each deployment can tune it.
+
+def env_bool(name, default):
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes', 'on')
+
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = gunicorn_workers()
+# only used by gthread; keep at or below DB_POOL_SIZE
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# import the app once in the master so workers share its pages copy-on-write
+preload_app = env_bool('GUNICORN_PRELOAD', 'true')
+
+# recycle workers to cap slow leaks, staggered so they don't restart together
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# heartbeat files on tmpfs; a disk-backed /tmp can stall workers in containers
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# workers share /metrics samples through files here; it must be set
+# before the app (and prometheus_client) is imported
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/dev/shm/prometheus' if os.path.isdir('/dev/shm')
+                      else '/tmp/prometheus')
+
+
+def on_starting(server):
+    # samples from a previous run of the master must not be merged in
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def when_ready(server):
+    # the preloaded app is built; move it out of the GC's reach so
+    # collections in the workers don't touch (and copy) the shared pages
+    if preload_app:
+        import gc
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # with preload the master imported app.py; give every worker its own
+    # database pool and hashing pool instead of the inherited ones, and
+    # open a few connections before the worker accepts requests
+    import app
+    app.after_fork()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,14 +1,24 @@
 
 
+CREATE TABLE IF NOT EXISTS `departments` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `name` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_departments_name` (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 CREATE TABLE IF NOT EXISTS `users` (
   `id` INT NOT NULL AUTO_INCREMENT,
   `username` VARCHAR(255) NOT NULL,
   `password` VARCHAR(255) NOT NULL,
-  `department` VARCHAR(255) NOT NULL,
+  `department_id` INT NOT NULL,
   `role` VARCHAR(50) NOT NULL DEFAULT 'user',
   `full_name` VARCHAR(255) DEFAULT NULL,
   PRIMARY KEY (`id`),
-  UNIQUE KEY `uq_users_username` (`username`)
+  UNIQUE KEY `uq_users_username` (`username`),
+  KEY `idx_users_role_department` (`role`, `department_id`, `id`),
+  KEY `idx_users_department` (`department_id`, `role`, `id`),
+  CONSTRAINT `fk_users_department` FOREIGN KEY (`department_id`) REFERENCES `departments` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 CREATE TABLE IF NOT EXISTS `Evaluation_aspects` (
@@ -39,6 +49,7 @@ CREATE TABLE IF NOT EXISTS `Evaluation_aspects` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `uq_evaluation_aspects_user_year` (`evaluation_year`, `user_id`),
   KEY `idx_evaluation_aspects_user` (`user_id`),
+  KEY `idx_evaluation_aspects_created` (`created_at`, `id`),
   CONSTRAINT `fk_evaluation_aspects_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -54,6 +65,7 @@ CREATE TABLE IF NOT EXISTS `Scientific_production` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `uq_scientific_production_user_year` (`evaluation_year`, `user_id`),
   KEY `idx_scientific_production_user` (`user_id`),
+  KEY `idx_scientific_production_created` (`created_at`, `id`),
   CONSTRAINT `fk_scientific_production_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -67,8 +79,11 @@ CREATE TABLE IF NOT EXISTS `Scientific_research` (
   `year` VARCHAR(20) DEFAULT NULL,
   `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `research_type` TEXT,
+  `research_category` TINYINT UNSIGNED NOT NULL DEFAULT 0,
+  `publisher_category` TINYINT UNSIGNED NOT NULL DEFAULT 0,
   PRIMARY KEY (`id`),
   KEY `idx_scientific_research_user` (`user_id`),
+  KEY `idx_scientific_research_category` (`research_category`, `publisher_category`, `user_id`),
   CONSTRAINT `fk_scientific_research_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -96,7 +111,8 @@ CREATE TABLE IF NOT EXISTS `academic_data` (
   `credit_hours` INT DEFAULT NULL,
   `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
-  KEY `idx_academic_data_user` (`user_id`),
+  KEY `idx_academic_data_user_created` (`user_id`, `created_at`, `id`),
+  KEY `idx_academic_data_created` (`created_at`, `id`),
   CONSTRAINT `fk_academic_data_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -110,7 +126,8 @@ CREATE TABLE IF NOT EXISTS `activity_data` (
   `place` TEXT,
   `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   PRIMARY KEY (`id`),
-  KEY `idx_activity_data_user` (`user_id`),
+  KEY `idx_activity_data_user_created` (`user_id`, `created_at`, `id`),
+  KEY `idx_activity_data_created` (`created_at`, `id`),
   CONSTRAINT `fk_activity_data_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
@@ -188,3 +205,23 @@ CREATE TABLE IF NOT EXISTS `university_evaluation` (
   KEY `idx_university_evaluation_user` (`user_id`),
   CONSTRAINT `fk_university_evaluation_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+
+CREATE TABLE IF NOT EXISTS `data_versions` (
+  `scope` VARCHAR(100) NOT NULL,
+  `version` INT UNSIGNED NOT NULL DEFAULT 0,
+  PRIMARY KEY (`scope`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+
+CREATE TABLE IF NOT EXISTS `evaluation_rankings` (
+  `user_id` INT NOT NULL,
+  `evaluation_year` INT NOT NULL,
+  `department_id` INT NOT NULL,
+  `total` SMALLINT UNSIGNED NOT NULL,
+  `sections` TINYINT UNSIGNED NOT NULL,
+  PRIMARY KEY (`user_id`, `evaluation_year`),
+  KEY `idx_evaluation_rankings_rank` (`department_id`, `evaluation_year`, `total`, `user_id`),
+  CONSTRAINT `fk_evaluation_rankings_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `fk_evaluation_rankings_department` FOREIGN KEY (`department_id`) REFERENCES `departments` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,148 @@
+import os
+import random
+import re
+import sys
+
+from locust import HttpUser, between, task
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seed import department_names  # noqa: E402
+
+
+# Load-test scenarios per role against a database filled by `flask seed`.
+# Accounts follow the seed's naming: <prefix>_admin, heads are the first
+# SEED_DEPARTMENTS accounts, everyone after them is regular faculty.
+#
+#   locust -f loadtest/locustfile.py --host http://127.0.0.1:5000 \
+#       --headless -u 100 -r 10 -t 5m --csv loadtest/results
+#
+# The console summary and results_stats.csv list requests/s and the
+# 50/95/99th percentiles for every route name below.
+
+PREFIX = os.getenv('SEED_PREFIX', 'seed')
+PASSWORD = os.getenv('SEED_PASSWORD', 'seed1234')
+FACULTY = int(os.getenv('SEED_FACULTY', '200'))
+DEPARTMENTS = int(os.getenv('SEED_DEPARTMENTS', '10'))
+
+PROFILE_ID = re.compile(r'persons13w4z6e7e5a4r76n(\d+)w46das5s4a6')
+CURSOR = re.compile(r'(?:[?&;])(after|semesters_after)=([\w=-]+)')
+
+
+def profile_url(user_id):
+    return '/view/persons13w4z6e7e5a4r76n%dw46das5s4a6' % user_id
+
+
+class SeededUser(HttpUser):
+    abstract = True
+    wait_time = between(1, 3)
+    username = None
+
+    def on_start(self):
+        response = self.client.post('/login', data={'username': self.username, 'password': PASSWORD},
+                                    name='/login')
+        match = PROFILE_ID.search(response.url or '')
+        self.user_id = int(match.group(1)) if match else None
+        self.member_ids = []
+
+    def paged(self, url, name):
+        # first page, then follow the next-page cursor once when there is one
+        response = self.client.get(url, name=name)
+        match = CURSOR.search(response.text)
+        if match:
+            separator = '&' if '?' in url else '?'
+            self.client.get('%s%s%s=%s' % (url, separator, match.group(1), match.group(2)), name=name + ' (page 2)')
+        return response
+
+
+class Faculty(SeededUser):
+    weight = 8
+
+    def on_start(self):
+        self.username = '%s_%05d' % (PREFIX, random.randint(DEPARTMENTS + 1, FACULTY))
+        super().on_start()
+
+    @task(6)
+    def own_profile(self):
+        if self.user_id:
+            self.client.get(profile_url(self.user_id), name='/view/persons[id]')
+
+    @task(3)
+    def own_records(self):
+        self.paged('/view', '/view')
+
+    @task(1)
+    def add_course(self):
+        self.client.post('/semester_add', name='/semester_add', data={
+            'semester': 'Fall', 'course_code': 'LT%d' % random.randint(100, 999), 'num_students': '40',
+            'teaching_load': '4', 'course_name': 'Load test', 'semester_type': 'Fall', 'credit_hours': '2',
+            'd2l': 'yes', 'QuestionMark': 'yes'})
+
+    @task(1)
+    def add_activity(self):
+        self.client.post('/activity_add', name='/activity_add', data={
+            'activity_title': 'Load test workshop', 'date': '2024-01-01', 'duration': '1',
+            'participation_type': 'حضور', 'place': 'Cairo'})
+
+
+class Head(SeededUser):
+    weight = 2
+
+    def on_start(self):
+        self.username = '%s_%05d' % (PREFIX, random.randint(1, DEPARTMENTS))
+        super().on_start()
+        response = self.client.get('/view/users', name='/view/users')
+        self.member_ids = [int(i) for i in set(PROFILE_ID.findall(response.text))]
+
+    @task(4)
+    def department_members(self):
+        self.client.get('/view/users', name='/view/users')
+
+    @task(4)
+    def member_profile(self):
+        if self.member_ids:
+            self.client.get(profile_url(random.choice(self.member_ids)), name='/view/persons[id]')
+
+    @task(3)
+    def kpis(self):
+        self.client.get('/kpis', name='/kpis')
+
+    @task(2)
+    def criteria(self):
+        self.paged('/view/criteria_of_evaluation', '/view/criteria_of_evaluation')
+
+    @task(2)
+    def production(self):
+        self.paged('/view/Scientific_production', '/view/Scientific_production')
+
+    @task(1)
+    def university(self):
+        self.client.get('/view/university_evaluation', name='/view/university_evaluation')
+
+    @task(1)
+    def export(self):
+        self.client.get('/export/academic_data?format=csv', name='/export/[table]')
+
+
+class Admin(SeededUser):
+    weight = 1
+
+    def on_start(self):
+        self.username = '%s_admin' % PREFIX
+        super().on_start()
+
+    @task(4)
+    def all_faculty(self):
+        self.paged('/view/all_users?department=All', '/view/all_users')
+
+    @task(3)
+    def heads(self):
+        self.client.get('/view/users', name='/view/users')
+
+    @task(3)
+    def kpis(self):
+        self.client.get('/kpis?department=All', name='/kpis')
+
+    @task(1)
+    def department_kpis(self):
+        department = random.choice(department_names(DEPARTMENTS))
+        self.client.get('/kpis', params={'department': department}, name='/kpis?department')
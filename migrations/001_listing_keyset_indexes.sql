@@ -0,0 +1,22 @@
+-- Composite indexes backing keyset pagination on /view, /view/Scientific_production,
+-- /view/criteria_of_evaluation and /view/all_users.
+-- Fresh databases get these from queries.sql; run this once on existing ones.
+
+ALTER TABLE `users`
+  ADD KEY `idx_users_role_department` (`role`, `department`, `id`);
+
+ALTER TABLE `academic_data`
+  ADD KEY `idx_academic_data_user_created` (`user_id`, `created_at`, `id`),
+  ADD KEY `idx_academic_data_created` (`created_at`, `id`),
+  DROP KEY `idx_academic_data_user`;
+
+ALTER TABLE `activity_data`
+  ADD KEY `idx_activity_data_user_created` (`user_id`, `created_at`, `id`),
+  ADD KEY `idx_activity_data_created` (`created_at`, `id`),
+  DROP KEY `idx_activity_data_user`;
+
+ALTER TABLE `Scientific_production`
+  ADD KEY `idx_scientific_production_created` (`created_at`, `id`);
+
+ALTER TABLE `Evaluation_aspects`
+  ADD KEY `idx_evaluation_aspects_created` (`created_at`, `id`);
@@ -0,0 +1,17 @@
+-- Classify Scientific_research once instead of LIKE-scanning TEXT columns.
+-- research_category:  0 = other, 1 = research paper (research_type contains "بحث")
+-- publisher_category: 0 = other, 1 = conference ("مؤتمر"), 2 = journal ("مجلة")
+-- New rows are classified by the application on insert; this backfills existing ones.
+
+ALTER TABLE `Scientific_research`
+  ADD COLUMN `research_category` TINYINT UNSIGNED NOT NULL DEFAULT 0,
+  ADD COLUMN `publisher_category` TINYINT UNSIGNED NOT NULL DEFAULT 0,
+  ADD KEY `idx_scientific_research_category` (`research_category`, `publisher_category`, `user_id`);
+
+UPDATE `Scientific_research`
+SET `research_category` = IF(`research_type` LIKE '%بحث%', 1, 0),
+    `publisher_category` = CASE
+        WHEN `Publisher` LIKE '%مجلة%' THEN 2
+        WHEN `Publisher` LIKE '%مؤتمر%' THEN 1
+        ELSE 0
+    END;
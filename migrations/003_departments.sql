@@ -0,0 +1,27 @@
+-- Move users.department (unindexed VARCHAR) into a departments dimension
+-- table referenced by an indexed users.department_id.
+
+CREATE TABLE IF NOT EXISTS `departments` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `name` VARCHAR(255) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_departments_name` (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+INSERT IGNORE INTO `departments` (`name`)
+SELECT DISTINCT `department` FROM `users`;
+
+ALTER TABLE `users`
+  ADD COLUMN `department_id` INT NULL AFTER `password`;
+
+UPDATE `users`
+JOIN `departments` ON `departments`.`name` = `users`.`department`
+SET `users`.`department_id` = `departments`.`id`;
+
+ALTER TABLE `users`
+  MODIFY `department_id` INT NOT NULL,
+  DROP KEY `idx_users_role_department`,
+  DROP COLUMN `department`,
+  ADD KEY `idx_users_role_department` (`role`, `department_id`, `id`),
+  ADD KEY `idx_users_department` (`department_id`, `role`, `id`),
+  ADD CONSTRAINT `fk_users_department` FOREIGN KEY (`department_id`) REFERENCES `departments` (`id`);
@@ -0,0 +1,13 @@
+-- Change counters, bumped by the application in the same transaction as
+-- each write. A scope is one of:
+--   "user:<id>:<table>"        one person's rows of a table (profile sections)
+--   "department:<id>:<table>"  a department's rows of a table (KPIs, rankings,
+--                              department listings)
+--   "all:<table>"              any row of a table (faculty-wide pages)
+-- Cached fragments and ETags of conditional GETs are derived from them.
+
+CREATE TABLE IF NOT EXISTS `data_versions` (
+  `scope` VARCHAR(100) NOT NULL,
+  `version` INT UNSIGNED NOT NULL DEFAULT 0,
+  PRIMARY KEY (`scope`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,35 @@
+-- Per-person yearly evaluation totals over Evaluation_aspects,
+-- ethics_responsibility, university_evaluation and Scientific_production,
+-- kept next to the person's department so rankings and percentiles are
+-- range scans of idx_evaluation_rankings_rank. The application refreshes a
+-- person's row with every evaluation written; this backfills the history.
+
+CREATE TABLE IF NOT EXISTS `evaluation_rankings` (
+  `user_id` INT NOT NULL,
+  `evaluation_year` INT NOT NULL,
+  `department_id` INT NOT NULL,
+  `total` SMALLINT UNSIGNED NOT NULL,
+  `sections` TINYINT UNSIGNED NOT NULL,
+  PRIMARY KEY (`user_id`, `evaluation_year`),
+  KEY `idx_evaluation_rankings_rank` (`department_id`, `evaluation_year`, `total`, `user_id`),
+  CONSTRAINT `fk_evaluation_rankings_user` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+  CONSTRAINT `fk_evaluation_rankings_department` FOREIGN KEY (`department_id`) REFERENCES `departments` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+REPLACE INTO `evaluation_rankings` (`user_id`, `evaluation_year`, `department_id`, `total`, `sections`)
+SELECT `scores`.`user_id`, `scores`.`evaluation_year`, `users`.`department_id`, SUM(`scores`.`score`), COUNT(*)
+FROM (
+  SELECT `user_id`, `evaluation_year`, `evaluation_sum` AS `score`
+  FROM `Evaluation_aspects` WHERE `evaluation_sum` IS NOT NULL
+  UNION ALL
+  SELECT `user_id`, `evaluation_year`, `evaluation_sum`
+  FROM `ethics_responsibility` WHERE `evaluation_sum` IS NOT NULL
+  UNION ALL
+  SELECT `user_id`, `evaluation_year`, `evaluation_sum`
+  FROM `university_evaluation` WHERE `evaluation_sum` IS NOT NULL
+  UNION ALL
+  SELECT `user_id`, `evaluation_year`, `Scientific_research_Evaluation` + `supervision_Graduation_Evaluation`
+  FROM `Scientific_production` WHERE `supervision_Graduation_Evaluation` IS NOT NULL
+) AS `scores`
+JOIN `users` ON `users`.`id` = `scores`.`user_id`
+GROUP BY `scores`.`user_id`, `scores`.`evaluation_year`, `users`.`department_id`;
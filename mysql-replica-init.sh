@@ -0,0 +1,20 @@
+#!/bin/bash
+# First start of the local replica (docker compose --profile replica): copy
+# the primary with a consistent, GTID-stamped dump, then replicate from it.
+set -euo pipefail
+
+mysql=(mysql -uroot -p"$MYSQL_ROOT_PASSWORD")
+
+"${mysql[@]}" -e 'RESET MASTER'
+mysqldump -h "$SOURCE_HOST" -uroot -p"$SOURCE_ROOT_PASSWORD" --databases "$SOURCE_DATABASE" \
+    --single-transaction --set-gtid-purged=ON --triggers --routines --events | "${mysql[@]}"
+
+"${mysql[@]}" <<SQL
+-- the app only reads here; REPLICATION CLIENT lets it check the lag
+GRANT SELECT ON \`$SOURCE_DATABASE\`.* TO '$MYSQL_USER'@'%';
+GRANT REPLICATION CLIENT ON *.* TO '$MYSQL_USER'@'%';
+CHANGE REPLICATION SOURCE TO SOURCE_HOST='$SOURCE_HOST', SOURCE_USER='root',
+    SOURCE_PASSWORD='$SOURCE_ROOT_PASSWORD', SOURCE_AUTO_POSITION=1, GET_SOURCE_PUBLIC_KEY=1;
+START REPLICA;
+SET PERSIST super_read_only = ON;
+SQL
@@ -0,0 +1,171 @@
+import random
+from datetime import datetime, timedelta
+
+
+# Deterministic synthetic data for `flask seed`. Each table gets its own
+# random.Random derived from the seed and the table name, so a table's
+# rows do not depend on which other tables were generated. Rows are plain
+# tuples in the column order listed in TABLES, ready for executemany.
+
+DEPARTMENT_NAMES = [
+    'Medical Education', 'Research', 'Histology', 'Biochemistry', 'Anatomy', 'Medicine',
+    'Physiology', 'Pharmacology', 'Pathology', 'Microbiology', 'Parasitology', 'Forensic Medicine',
+    'Public Health', 'Pediatrics', 'Surgery', 'Obstetrics', 'Ophthalmology', 'Dermatology',
+    'Psychiatry', 'Radiology',
+]
+
+FIRST_NAMES = ['ahmed', 'mohamed', 'sara', 'laila', 'yara', 'omar', 'nour', 'salma', 'khaled', 'dina',
+               'hassan', 'mona', 'youssef', 'aya', 'karim', 'heba', 'tarek', 'rana', 'mostafa', 'mariam']
+LAST_NAMES = ['mohamed', 'ali', 'hassan', 'ibrahim', 'mahmoud', 'abdelrahman', 'saeed', 'farouk',
+              'el-sayed', 'gamal', 'kamal', 'nabil']
+
+RESEARCH_TYPES = ['بحث', 'بحث', 'بحث', 'مراجعة', 'كتاب']
+PUBLISHERS = ['مجلة علمية محكمة', 'مجلة دولية', 'مؤتمر دولي', 'مؤتمر محلي', 'دار نشر']
+AGENCIES = ['Scopus', 'Web of Science', 'PubMed', 'EKB']
+TASK_LEVELS = ['القسم', 'الكلية', 'الجامعة']
+TASK_TYPES = ['لجنة', 'منسق برنامج', 'عضو مجلس', 'مراقبة امتحانات']
+PARTICIPATION_TYPES = ['حضور', 'محاضر', 'منظم']
+SEMESTER_TYPES = ['Fall', 'Spring', 'Summer']
+PLACES = ['Cairo', 'Alexandria', 'Mansoura', 'Assiut', 'Dubai', 'Riyadh', 'London', 'Online']
+
+CRITERIA = ['Develop_courses', 'Prepare_file', 'Electronic_tests', 'Prepare_material_content',
+            'Use_learning_effectively', 'teaching_methods', 'Methods_student', 'preparing_test_questions',
+            'Provide_academic_guidance']
+CRITERIA_EVALUATIONS = ['Develop_courses_Evaluation', 'Prepare_file_Evaluation', 'Electronic_tests_Evaluation',
+                        'Prepare_material_Evaluation', 'Use_learning_Evaluation', 'teaching_methods_Evaluation',
+                        'Methods_student_Evaluation', 'preparing_test_Evaluation', 'Provide_academic_Evaluation']
+ETHICS = ['professional_values', 'offer_encouragement', 'respect_leaders', 'take_responsibility',
+          'decent_appearance', 'punctuality', 'office_hours']
+# the self-assessment form's max score of each ETHICS field
+ETHICS_MAXIMA = [2, 2, 2, 2, 2, 2, 3]
+ETHICS_EVALUATIONS = [name + '_evaluation' for name in ETHICS]
+UNIVERSITY = ['department_load', 'workshop_develop', 'program_bank', 'medical_services']
+UNIVERSITY_EVALUATIONS = [name + '_Evaluation' for name in UNIVERSITY]
+PRODUCTION_EVALUATIONS = ['Scientific_research_Evaluation', 'supervision_Graduation_Evaluation']
+
+
+def department_names(count):
+    names = DEPARTMENT_NAMES[:count]
+    names += ['Department %d' % i for i in range(len(names) + 1, count + 1)]
+    return names
+
+
+def table_random(seed, table):
+    return random.Random('%s:%s' % (seed, table))
+
+
+def username(prefix, i):
+    return '%s_%05d' % (prefix, i + 1)
+
+
+def users(seed, prefix, department_ids, faculty, password_hash):
+    # one head per department, the rest spread evenly; plus one admin
+    rng = table_random(seed, 'users')
+    yield ('%s_admin' % prefix, password_hash, department_ids[0], 'admin', 'Seed Administrator')
+    for i in range(faculty):
+        department_id = department_ids[i % len(department_ids)]
+        role = 'head' if i < len(department_ids) else 'user'
+        full_name = '%s %s' % (rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        yield (username(prefix, i), password_hash, department_id, role, full_name)
+
+
+def created_at(rng, year, now):
+    start = datetime(year, 1, 1)
+    end = min(datetime(year + 1, 1, 1), now)
+    return start + timedelta(seconds=rng.randrange(max(1, int((end - start).total_seconds()))))
+
+
+def scores(rng, count, low=1, high=5):
+    return [rng.randint(low, high) for _ in range(count)]
+
+
+def evaluations(rng, columns, maxima, low=1):
+    # maxima (column -> the form's max score) is None while pending
+    if maxima is None:
+        return [None] * len(columns)
+    return [rng.randint(low, maxima[column]) for column in columns]
+
+
+def evaluations_with_sum(rng, columns, maxima):
+    values = evaluations(rng, columns, maxima)
+    return values + [None if maxima is None else sum(values)]
+
+
+def academic_row(rng, year, when, maxima):
+    semester_type = rng.choice(SEMESTER_TYPES)
+    code = '%s%d' % (rng.choice(['ANA', 'BIO', 'HIS', 'PHY', 'PHA', 'MED']), rng.randint(100, 499))
+    return ('%s %d' % (semester_type, year), code, rng.randint(20, 400), '%d ساعات' % rng.randint(2, 12),
+            'Course %s' % code, semester_type, rng.randint(1, 4), 'yes', 'yes', when)
+
+
+def activity_row(rng, year, when, maxima):
+    return ('Workshop %d' % rng.randint(1, 500), when.date(), '%d أيام' % rng.randint(1, 5),
+            rng.choice(PARTICIPATION_TYPES), rng.choice(PLACES), when)
+
+
+def research_row(rng, year, when, maxima):
+    return ('Study %d on %s' % (rng.randint(1, 100000), rng.choice(CRITERIA)),
+            ', '.join(rng.choice(FIRST_NAMES) for _ in range(rng.randint(1, 5))),
+            rng.choice(PUBLISHERS), rng.choice(AGENCIES), str(year), when, rng.choice(RESEARCH_TYPES),
+            '10.%d/%d' % (rng.randint(1000, 9999), rng.randint(10000, 99999)))
+
+
+def conference_row(rng, year, when, maxima):
+    return (rng.choice(PLACES), rng.choice(PARTICIPATION_TYPES), rng.choice(PLACES), str(year), when)
+
+
+def service_row(rng, year, when, maxima):
+    return (rng.choice(TASK_LEVELS), rng.choice(TASK_TYPES), '', when)
+
+
+def production_row(rng, year, when, maxima):
+    return (rng.randint(0, 10), rng.randint(0, 10), when, *evaluations(rng, PRODUCTION_EVALUATIONS, maxima, 0))
+
+
+def criteria_row(rng, year, when, maxima):
+    values = scores(rng, len(CRITERIA))
+    return (*values, sum(values), when, *evaluations_with_sum(rng, CRITERIA_EVALUATIONS, maxima))
+
+
+def ethics_row(rng, year, when, maxima):
+    values = [rng.randint(0, maximum) for maximum in ETHICS_MAXIMA]
+    return (*values, sum(values), when, *evaluations_with_sum(rng, ETHICS_EVALUATIONS, maxima))
+
+
+def university_row(rng, year, when, maxima):
+    values = scores(rng, len(UNIVERSITY), 0, 5)
+    return (*values, sum(values), when, *evaluations_with_sum(rng, UNIVERSITY_EVALUATIONS, maxima))
+
+
+# table -> (columns after user_id, (min, max) rows per user per year, row builder)
+TABLES = {
+    'academic_data': (['semester', 'course_code', 'num_students', 'teaching_load', 'course_name',
+                       'semester_type', 'credit_hours', 'd2l', 'QuestionMark', 'created_at'],
+                      (2, 6), academic_row),
+    'activity_data': (['activity_title', 'activity_date', 'duration', 'participation_type', 'place',
+                       'created_at'], (0, 4), activity_row),
+    'Scientific_research': (['scientific_output', 'Authors_names', 'Publisher', 'Agency', 'year',
+                             'created_at', 'research_type', 'DOI'], (0, 4), research_row),
+    'participate_conference': (['location', 'type_part', 'place', 'year', 'created_at'], (0, 2), conference_row),
+    'University_Service': (['task_level', 'task_type', 'notes', 'created_at'], (0, 2), service_row),
+    'Scientific_production': (['Scientific_research', 'supervision_Graduation', 'created_at']
+                              + PRODUCTION_EVALUATIONS, (1, 1), production_row),
+    'Evaluation_aspects': (CRITERIA + ['aspects_sum', 'created_at'] + CRITERIA_EVALUATIONS + ['evaluation_sum'],
+                           (1, 1), criteria_row),
+    'ethics_responsibility': (ETHICS + ['aspects_sum', 'created_at'] + ETHICS_EVALUATIONS + ['evaluation_sum'],
+                              (1, 1), ethics_row),
+    'university_evaluation': (UNIVERSITY + ['aspects_sum', 'created_at'] + UNIVERSITY_EVALUATIONS + ['evaluation_sum'],
+                              (1, 1), university_row),
+}
+
+
+def table_rows(seed, table, user_ids, years, maxima, now=None):
+    # past years come back already evaluated, each score within maxima
+    # (evaluation column -> the form's max score); the current year is pending
+    now = now or datetime.now()
+    _, (low, high), build = TABLES[table]
+    rng = table_random(seed, table)
+    for user_id in user_ids:
+        for year in range(now.year - years + 1, now.year + 1):
+            for _ in range(rng.randint(low, high)):
+                yield (user_id,) + build(rng, year, created_at(rng, year, now), maxima if year < now.year else None)
@@ -0,0 +1,195 @@
+import csv
+import io
+import re
+import zipfile
+from decimal import Decimal
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+# Streaming CSV / XLSX writers. Both take the column names and an iterable of
+# row batches and yield the encoded file in chunks, one chunk per batch, so
+# the whole export never sits in memory at once.
+
+def csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the Arabic text as UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink:
+    # write-only file object for ZipFile; the zip is drained after each batch
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+_XLSX_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="%s">'
+        '<Relationship Id="rId1" Type="%s/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>' % (_PKG_REL_NS, _REL_NS)
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="%s">'
+        '<Relationship Id="rId1" Type="%s/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>' % (_PKG_REL_NS, _REL_NS)
+    ),
+}
+
+_ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return '<c><v>%s</v></c>' % value
+    text = escape(_ILLEGAL_XML.sub('', str(value)))
+    return '<c t="inlineStr"><is><t xml:space="preserve">%s</t></is></c>' % text
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def xlsx_chunks(columns, batches, sheet_name='Sheet1'):
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, body in _XLSX_PARTS.items():
+            archive.writestr(name, body)
+        archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="%s" xmlns:r="%s"><sheets>'
+            '<sheet name="%s" sheetId="1" r:id="rId1"/>'
+            '</sheets></workbook>' % (_XLSX_NS, _REL_NS, escape(sheet_name[:31]))
+        ))
+        yield sink.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="%s"><sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews>'
+                '<sheetData>' % _XLSX_NS + _xlsx_row(columns)
+            ).encode('utf-8'))
+            for batch in batches:
+                sheet.write(''.join(_xlsx_row(values) for values in batch).encode('utf-8'))
+                yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+
+# Streaming readers for uploads. Both yield one list of cell values per row;
+# XLSX sheets are walked with iterparse so only the current row is in memory.
+
+def csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from csv.reader(text)
+    finally:
+        text.detach()
+
+
+_MAIN = '{%s}' % _XLSX_NS
+_CELL_REF = re.compile(r'([A-Z]+)')
+
+
+def _column_number(ref):
+    number = 0
+    for letter in _CELL_REF.match(ref).group(1):
+        number = number * 26 + ord(letter) - 64
+    return number - 1
+
+
+def _first_sheet(archive):
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find('%ssheets/%ssheet' % (_MAIN, _MAIN))
+    rel_id = sheet.get('{%s}id' % _REL_NS)
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels:
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else 'xl/' + target
+    raise ValueError('workbook has no worksheet')
+
+
+def _shared_strings(archive):
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as part:
+        for _, item in ElementTree.iterparse(part):
+            if item.tag == _MAIN + 'si':
+                strings.append(''.join(t.text or '' for t in item.iter(_MAIN + 't')))
+                item.clear()
+    return strings
+
+
+def _cell_value(cell, strings):
+    kind = cell.get('t')
+    if kind == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(_MAIN + 't'))
+    value = cell.findtext(_MAIN + 'v')
+    if value is None:
+        return None
+    if kind == 's':
+        return strings[int(value)]
+    if kind == 'b':
+        return value == '1'
+    if kind in ('str', 'e'):
+        return value
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+def xlsx_rows(stream):
+    with zipfile.ZipFile(stream) as archive:
+        strings = _shared_strings(archive)
+        with archive.open(_first_sheet(archive)) as sheet:
+            for _, row in ElementTree.iterparse(sheet):
+                if row.tag != _MAIN + 'row':
+                    continue
+                values = []
+                for cell in row.iter(_MAIN + 'c'):
+                    ref = cell.get('r')
+                    if ref:
+                        values.extend([None] * (_column_number(ref) - len(values)))
+                    values.append(_cell_value(cell, strings))
+                row.clear()
+                yield values